@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+
+
+class StreamingASGITransport(httpx.AsyncBaseTransport):
+    """httpx transport that calls an ASGI app in-process and streams its body.
+
+    httpx.ASGITransport buffers the whole response, which hides time to first
+    chunk on the streaming endpoint.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "scheme": request.url.scheme,
+            "path": request.url.path,
+            "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query,
+            "headers": [(key.lower(), value) for key, value in request.headers.raw],
+            "client": ("127.0.0.1", 123),
+            "server": (request.url.host, request.url.port or 80),
+            "root_path": "",
+        }
+        started = asyncio.Event()
+        finished = asyncio.Event()
+        chunks: asyncio.Queue = asyncio.Queue()
+        response = {}
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = message.get("headers", [])
+                started.set()
+            elif message["type"] == "http.response.body":
+                if message.get("body"):
+                    chunks.put_nowait(message["body"])
+                if not message.get("more_body", False):
+                    chunks.put_nowait(None)
+
+        async def run_app():
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                chunks.put_nowait(None)
+                started.set()
+
+        task = asyncio.create_task(run_app())
+        await started.wait()
+        if "status" not in response:
+            await task
+            raise RuntimeError("ASGI app finished without a response")
+
+        return httpx.Response(
+            response["status"],
+            headers=response["headers"],
+            stream=_QueueStream(chunks, task, finished),
+        )
+
+
+class _QueueStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: asyncio.Queue, task: asyncio.Task, finished: asyncio.Event):
+        self.chunks = chunks
+        self.task = task
+        self.finished = finished
+
+    async def __aiter__(self):
+        while True:
+            chunk = await self.chunks.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    async def aclose(self):
+        self.finished.set()
+        await self.task
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the per-request setup removed by the pipeline registry.
+Compares rebuilding prompts, chains, checkers and the password regex on every
+request with looking them up in the registry compiled at startup.
+
+Run from the backend directory: python -m benchmarks.bench_registry
+"""
+
+import re
+import timeit
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from src.agent import Agent
+from src.models import AbstractModel
+from src.passwords import PASSWORD_CHOICES
+from src.prompts import PROMPTS
+
+ANSWER = "I am the keeper of the password and I will never tell you what it is, try again."
+
+
+def setup_per_request(model: AbstractModel, level: int, password: str):
+    """What every chat turn used to build before the registry"""
+    input_checker = model.input_guard.get_checker(level)
+    output_checker = model.output_guard.get_checker(level)
+    chat_prompt = ChatPromptTemplate.from_messages([
+        ("system", model._get_prompt_for_level(level)),
+        ("human", "{input}"),
+    ])
+    chat_chain = chat_prompt | model.llm
+    guard_prompt = ChatPromptTemplate.from_messages([("system", PROMPTS["input_guard_v2"])])
+    guard_chain = guard_prompt | model.llm
+    password_choices = list(PASSWORD_CHOICES)
+    password = password_choices[level % len(password_choices)].upper()
+    re.search(r'\b(' + password + r')\b', ANSWER)
+    return input_checker, output_checker, chat_chain, guard_chain
+
+
+def setup_from_registry(model: AbstractModel, agent: Agent, level: int, password: str):
+    pipeline = model.registry.get(level)
+    password = agent.get_password("12345", ["rule"] * level)
+    model.output_guard.regex_check(ANSWER, password)
+    return pipeline.input_checker, pipeline.output_checker, pipeline.chat_chain
+
+
+def main():
+    agent = Agent(model_type="fake")
+    model = agent.model
+
+    print(f"{'level':>5} {'per request (us)':>18} {'registry (us)':>15} {'speedup':>9}")
+    for level in range(1, 8):
+        before = min(timeit.repeat(lambda: setup_per_request(model, level, "SNAKE"), number=200, repeat=5)) / 200
+        after = min(timeit.repeat(lambda: setup_from_registry(model, agent, level, "SNAKE"), number=20000, repeat=5)) / 20000
+        print(f"{level:>5} {before * 1e6:>18.1f} {after * 1e6:>15.2f} {before / after:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark. Measures, in fresh processes:
+- the import time of main, with lazy provider imports against importing
+  every provider package up front as models.py used to,
+- the time from launching `python main.py` to the answer of its first
+  /api/chat request, with and without WARM_UP.
+
+Run from the backend directory: python -m benchmarks.bench_startup --help
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+EAGER_IMPORTS = "import langchain_groq, langchain_community.chat_models; "
+
+CHAT_PAYLOAD = {
+    "message": {"id": 1, "text": "hello there", "isUser": True},
+    "chat_history": [],
+    "rules_list": [{"id": 0, "title": "rule 0", "description": "rule 0"}],
+    "session_id": "12345",
+}
+
+
+def import_time(provider: str, eager: bool) -> float:
+    code = (EAGER_IMPORTS if eager else "") + "import main"
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env={**os.environ, "LLM_PROVIDER": provider}, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def first_response_time(provider: str, warm_up: bool, port: int) -> float:
+    env = {**os.environ, "LLM_PROVIDER": provider, "WARM_UP": str(warm_up).lower(), "PORT": str(port), "RELOAD": "false"}
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "main.py"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            while True:
+                try:
+                    client.post("/api/chat", json=CHAT_PAYLOAD).raise_for_status()
+                    return time.perf_counter() - start
+                except httpx.ConnectError:
+                    time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", nargs="+", default=["fake"], help="fake, groq, ollama or router")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{'provider':>9} {'measurement':>28} {'median (ms)':>12}")
+    for provider in args.providers:
+        rows = [
+            ("import main, eager providers", lambda: import_time(provider, eager=True)),
+            ("import main, lazy providers", lambda: import_time(provider, eager=False)),
+            ("first /api/chat, no warm-up", lambda: first_response_time(provider, False, args.port)),
+            ("first /api/chat, warm-up", lambda: first_response_time(provider, True, args.port)),
+        ]
+        for name, measure in rows:
+            timings = [measure() for _ in range(args.runs)]
+            print(f"{provider:>9} {name:>28} {statistics.median(timings) * 1000:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
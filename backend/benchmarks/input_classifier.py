@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Train the local input classifier from logged LLM guard verdicts and report
+how often it agrees with the LLM guard.
+
+Collect verdicts by running the server with GUARD_VERDICT_LOG=verdicts.jsonl, then
+run from the backend directory:
+
+    python -m benchmarks.input_classifier train verdicts.jsonl input_classifier.json
+    python -m benchmarks.input_classifier eval verdicts.jsonl input_classifier.json
+
+Serve the trained model with INPUT_CLASSIFIER_PATH=input_classifier.json.
+"""
+
+import argparse
+import random
+import time
+from collections import defaultdict
+
+from src.local_classifier import HashedNgramClassifier, VerdictLog, parse_thresholds
+
+
+def split(records, holdout: float, seed: int):
+    records = list(records)
+    random.Random(seed).shuffle(records)
+    cut = int(len(records) * (1 - holdout))
+    return records[:cut], records[cut:]
+
+
+def evaluate(classifier: HashedNgramClassifier, records):
+    stats = defaultdict(lambda: {"total": 0, "decided": 0, "agree": 0, "false_safe": 0})
+    start = time.perf_counter()
+    for record in records:
+        level_stats = stats[record["level"]]
+        level_stats["total"] += 1
+        is_safe = classifier.classify(record["text"], record["level"])
+        if is_safe is None:
+            continue
+        level_stats["decided"] += 1
+        level_stats["agree"] += is_safe == record["safe"]
+        level_stats["false_safe"] += is_safe and not record["safe"]
+    elapsed = time.perf_counter() - start
+
+    print(f"{'level':>5} {'messages':>9} {'local share':>12} {'agreement':>10} {'false safe':>11}")
+    for level in sorted(stats):
+        s = stats[level]
+        decided = max(s["decided"], 1)
+        print(f"{level:>5} {s['total']:>9} {s['decided'] / s['total']:>11.1%} "
+              f"{s['agree'] / decided:>9.1%} {s['false_safe'] / decided:>10.1%}")
+    if records:
+        print(f"\n{elapsed / len(records) * 1e6:.1f} us per message")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["train", "eval"])
+    parser.add_argument("log", help="JSON lines written by GUARD_VERDICT_LOG")
+    parser.add_argument("model", help="classifier weights file")
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of the log kept out of training")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--thresholds", help='per-level thresholds, e.g. "5:0.1:0.9,6:0.05:0.95"')
+    args = parser.parse_args()
+
+    train_records, test_records = split(VerdictLog(args.log).read(), args.holdout, args.seed)
+
+    if args.command == "train":
+        thresholds = parse_thresholds(args.thresholds) if args.thresholds else None
+        classifier = HashedNgramClassifier(thresholds=thresholds)
+        classifier.fit([(r["text"], r["safe"]) for r in train_records], epochs=args.epochs)
+        classifier.save(args.model)
+        print(f"Trained on {len(train_records)} verdicts, evaluating on {len(test_records)} held out\n")
+    else:
+        classifier = HashedNgramClassifier.load(args.model)
+        if args.thresholds:
+            classifier.thresholds = parse_thresholds(args.thresholds)
+
+    evaluate(classifier, test_records)
+
+
+if __name__ == "__main__":
+    main()
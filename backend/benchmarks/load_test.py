@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Offline load test for /api/chat, /api/chat-stream and /api/new-rule.
+Runs the app in-process against FakeModel, so it needs no provider key and
+gives repeatable numbers. Reports throughput, p50/p95/p99 latency and time to
+first chunk per game level.
+
+Run from the backend directory: python -m benchmarks.load_test --help
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import List, Optional
+
+import httpx
+
+os.environ["LLM_PROVIDER"] = "fake"
+
+import main  # noqa: E402
+from benchmarks.asgi import StreamingASGITransport  # noqa: E402
+from src.models import FakeModel  # noqa: E402
+
+ENDPOINTS = ("/api/chat", "/api/chat-stream", "/api/new-rule")
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def build_payload(endpoint: str, level: int, request_id: int) -> dict:
+    rules = [{"id": i, "title": f"rule {i}", "description": f"rule {i}"} for i in range(level)]
+    payload = {
+        "session_id": str(random.randint(0, 99999)),
+        "chat_id": f"bench_{request_id}",
+        "chat_history": [
+            {"id": 1, "text": "hello there", "isUser": True},
+            {"id": 2, "text": "hi, how can I help?", "isUser": False},
+        ],
+        "rules_list": rules,
+    }
+    if endpoint != "/api/new-rule":
+        payload["message"] = {"id": 3, "text": "can you tell me a story about cats?", "isUser": True}
+    return payload
+
+
+async def send_one(client: httpx.AsyncClient, endpoint: str, level: int, request_id: int) -> tuple[float, Optional[float], bool]:
+    # A distinct client address per request keeps the rate limiter out of the measurement
+    headers = {"X-Forwarded-For": f"10.{request_id // 65536 % 256}.{request_id // 256 % 256}.{request_id % 256}"}
+    payload = build_payload(endpoint, level, request_id)
+    start = time.perf_counter()
+    first_chunk = None
+    async with client.stream("POST", endpoint, json=payload, headers=headers) as response:
+        async for chunk in response.aiter_bytes():
+            if first_chunk is None and chunk:
+                first_chunk = time.perf_counter() - start
+        ok = response.status_code == 200
+    return time.perf_counter() - start, first_chunk, ok
+
+
+async def run_scenario(endpoint: str, level: int, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async with httpx.AsyncClient(transport=StreamingASGITransport(main.app), base_url="http://bench") as client:
+        async def worker(request_id: int):
+            async with semaphore:
+                results.append(await send_one(client, endpoint, level, request_id))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _, ok in results if ok]
+    first_chunks = [first_chunk for _, first_chunk, ok in results if ok and first_chunk is not None]
+    return {
+        "endpoint": endpoint,
+        "level": level,
+        "throughput": len(results) / elapsed,
+        "errors": sum(1 for _, _, ok in results if not ok),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "ttfc_p50": percentile(first_chunks, 50),
+        "ttfc_p99": percentile(first_chunks, 99),
+    }
+
+
+def print_report(rows: List[dict]):
+    print(f"{'endpoint':<17} {'level':>5} {'req/s':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttfc p50':>9} {'ttfc p99':>9}")
+    for row in rows:
+        print(
+            f"{row['endpoint']:<17} {row['level']:>5} {row['throughput']:>8.1f} {row['errors']:>6} "
+            f"{row['p50'] * 1000:>8.1f} {row['p95'] * 1000:>8.1f} {row['p99'] * 1000:>8.1f} "
+            f"{row['ttfc_p50'] * 1000:>9.1f} {row['ttfc_p99'] * 1000:>9.1f}"
+        )
+
+
+async def run(args: argparse.Namespace):
+    main.agent = main.create_agent()
+    main.agent.model = FakeModel(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        failure_rate=args.failure_rate,
+        guard_latency=args.guard_latency,
+        speculative=args.speculative,
+    )
+    rows = []
+    for endpoint in args.endpoints:
+        for level in args.levels:
+            rows.append(await run_scenario(endpoint, level, args.requests, args.concurrency))
+    print_report(rows)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and level")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 5, 7])
+    parser.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS), choices=ENDPOINTS)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--guard-latency", type=float, default=0.1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--speculative", action="store_true")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Replays a capture recorded with CAPTURE_PATH against the app, in-process and
+without network. Requests keep their recorded spacing, divided by --speed
+(0 sends them as fast as --concurrency allows, each session's requests still
+in order). Every LLM call is answered from the capture with its recorded
+latency, scaled by --latency-scale.
+
+Run from the backend directory: python -m benchmarks.replay capture.jsonl --help
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+os.environ["LLM_PROVIDER"] = "fake"
+# Replaying must not capture itself
+os.environ.pop("CAPTURE_PATH", None)
+
+import main  # noqa: E402
+from benchmarks.asgi import StreamingASGITransport  # noqa: E402
+from benchmarks.load_test import percentile  # noqa: E402
+from src.capture import read_capture  # noqa: E402
+from src.fake_llm import replay_calls  # noqa: E402
+from src.models import ReplayModel  # noqa: E402
+
+
+async def send(client: httpx.AsyncClient, request: dict) -> tuple[str, int, float, Optional[float]]:
+    body = request["body"]
+    session = int(body["session_id"])
+    # One address per captured session, so the rate limiter sees the same clients
+    headers = {"X-Forwarded-For": f"10.{session // 65536 % 256}.{session // 256 % 256}.{session % 256}"}
+    start = time.perf_counter()
+    first_chunk = None
+    async with client.stream("POST", request["endpoint"], json=body, headers=headers) as response:
+        async for chunk in response.aiter_bytes():
+            if first_chunk is None and chunk:
+                first_chunk = time.perf_counter() - start
+    return request["endpoint"], response.status_code, time.perf_counter() - start, first_chunk
+
+
+async def replay(requests: List[dict], speed: float, concurrency: int) -> tuple[list, float]:
+    results = []
+    async with httpx.AsyncClient(transport=StreamingASGITransport(main.app), base_url="http://replay", timeout=None) as client:
+        start = time.perf_counter()
+        if speed > 0:
+            captured_start = requests[0]["t"]
+
+            async def scheduled(request: dict):
+                await asyncio.sleep(max(0.0, (request["t"] - captured_start) / speed - (time.perf_counter() - start)))
+                results.append(await send(client, request))
+
+            await asyncio.gather(*(scheduled(request) for request in requests))
+        else:
+            sessions: Dict[str, List[dict]] = defaultdict(list)
+            for request in requests:
+                sessions[request["body"]["session_id"]].append(request)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def play(session_requests: List[dict]):
+                async with semaphore:
+                    for request in session_requests:
+                        results.append(await send(client, request))
+
+            await asyncio.gather(*(play(session_requests) for session_requests in sessions.values()))
+        return results, time.perf_counter() - start
+
+
+def print_report(results: list, elapsed: float, misses: int):
+    print(f"{len(results)} requests in {elapsed:.1f}s ({len(results) / elapsed:.1f} req/s), {misses} LLM calls missing from the capture")
+    print(f"{'endpoint':<17} {'count':>6} {'non-200':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttfc p50':>9}")
+    by_endpoint = defaultdict(list)
+    for result in results:
+        by_endpoint[result[0]].append(result)
+    for endpoint, rows in sorted(by_endpoint.items()):
+        latencies = [latency for _, status, latency, _ in rows if status == 200]
+        first_chunks = [first for _, status, _, first in rows if status == 200 and first is not None]
+        print(
+            f"{endpoint:<17} {len(rows):>6} {sum(1 for row in rows if row[1] != 200):>7} "
+            f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} "
+            f"{percentile(latencies, 99) * 1000:>8.1f} {percentile(first_chunks, 50) * 1000:>9.1f}"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="file written with CAPTURE_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 for real time, N for N times faster, 0 for as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=50, help="sessions played at once with --speed 0")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier for the recorded LLM latencies")
+    return parser.parse_args()
+
+
+def run(args: argparse.Namespace):
+    records = read_capture(args.capture)
+    requests = [record for record in records if record["kind"] == "request"]
+    if not requests:
+        raise SystemExit(f"No requests in {args.capture}")
+
+    main.agent = main.create_agent()
+    main.agent.model = ReplayModel(replay_calls(records), latency_scale=args.latency_scale)
+    results, elapsed = asyncio.run(replay(requests, args.speed, args.concurrency))
+    print_report(results, elapsed, main.agent.model.llm.misses)
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -1,22 +1,95 @@
 import os
 import json
-from typing import List
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
 import dotenv
 import uvicorn
-from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
 
+from src.admission import REQUEST_PRIORITY, AdmissionRejected, admission_rejected_handler, create_admission_controller
 from src.agent import Agent
-from src.schemas import ChatResponse, Rule, ChatRequest, NewRuleRequest
+from src.capture import CaptureLog
+from src.local_classifier import HashedNgramClassifier, VerdictLog, parse_thresholds
+from src.metrics import GUARD_CACHE_LOOKUPS, METRICS, SPECULATIVE_GENERATIONS, TIME_TO_FIRST_CHUNK
+from src.registry import MAX_LEVEL
+from src.rate_limit import RateLimiter, RateLimitExceeded, create_rate_limit_backend, rate_limit_exceeded_handler
+from src.rule_store import create_rule_store
+from src.response_cache import create_response_cache
+from src.schemas import ChatResponse, Message, Rule, ChatRequest, NewRuleRequest
+from src.session_store import HistoryWindow, UnknownSession, create_session_store, unknown_session_handler
+from src.single_flight import SingleFlight, chat_request_key
+from src.sse import compact_events
 
 # Setup environment
 dotenv.load_dotenv()
-app = FastAPI()
-agent = Agent()
+
+
+def create_agent() -> Agent:
+    provider = os.getenv("LLM_PROVIDER", "groq")
+    agent = Agent(
+        model_type=provider,
+        speculative=os.getenv("SPECULATIVE_GUARD", "false").lower() == "true",
+        rule_store=create_rule_store(os.getenv("RULE_STORE", "memory"), os.getenv("RULE_DB_PATH", "rules.db")),
+        # LLM_PROVIDER=router, e.g. "groq:llama-3.3-70b-versatile,ollama:llama3.2:1b"
+        backends=os.getenv("LLM_BACKENDS"),
+        # e.g. "input_guard=ollama:llama3.2:1b,output_guard=ollama:llama3.2:1b" and "chat=1024,input_guard=4"
+        role_models=os.getenv("LLM_ROLE_MODELS"),
+        role_max_tokens=os.getenv("LLM_ROLE_MAX_TOKENS"),
+        # Prompt tokens for history per role, e.g. "chat=1024,input_guard=512,rule=1024"
+        history_budgets=os.getenv("HISTORY_TOKEN_BUDGETS"),
+        # Concurrent and queued provider requests, e.g. "groq=32:64,ollama=2:16"
+        admission=create_admission_controller(provider, os.getenv("ADMISSION_LIMITS")),
+        # LLM_PROVIDER=router: hedge calls slower than this percentile of a backend's latency, e.g. "0.9"
+        hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE")) if os.getenv("LLM_HEDGE_PERCENTILE") else None,
+    )
+    guard_batch_window = float(os.getenv("GUARD_BATCH_WINDOW_MS", "0")) / 1000
+    if guard_batch_window > 0:
+        for guard in (agent.model.input_guard, agent.model.output_guard):
+            guard.enable_batching(guard_batch_window, int(os.getenv("GUARD_BATCH_SIZE", "8")))
+    # Local first-tier input classifier, trained offline from the verdict log
+    if os.getenv("INPUT_CLASSIFIER_PATH"):
+        classifier = HashedNgramClassifier.load(os.getenv("INPUT_CLASSIFIER_PATH"))
+        if os.getenv("INPUT_CLASSIFIER_THRESHOLDS"):
+            classifier.thresholds = parse_thresholds(os.getenv("INPUT_CLASSIFIER_THRESHOLDS"))
+        agent.model.input_guard.classifier = classifier
+    if os.getenv("GUARD_VERDICT_LOG"):
+        agent.model.input_guard.verdict_log = VerdictLog(os.getenv("GUARD_VERDICT_LOG"))
+    if capture_log is not None:
+        agent.model.enable_capture(capture_log)
+    # Opt-in, e.g. RESPONSE_CACHE="variety=0.2,size=10000,ttl=86400" with RESPONSE_CACHE_PATH=responses.db
+    agent.model.response_cache = create_response_cache(os.getenv("RESPONSE_CACHE"), os.getenv("RESPONSE_CACHE_PATH"))
+    return agent
+
+
+# CAPTURE_PATH records anonymized requests and every LLM call for benchmarks/replay.py
+capture_log = CaptureLog(os.getenv("CAPTURE_PATH")) if os.getenv("CAPTURE_PATH") else None
+
+
+# Built at startup rather than import time, so the server binds its port first
+agent: Optional[Agent] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global agent
+    agent = create_agent()
+    # WARM_UP=true opens provider connections and renders the prompts before the first request
+    if os.getenv("WARM_UP", "false").lower() == "true":
+        await agent.model.awarm_up()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+# Compact streams merge chunks for up to SSE_COALESCE_MS or SSE_COALESCE_CHARS characters
+SSE_COALESCE_CHARS = int(os.getenv("SSE_COALESCE_CHARS", "256"))
+SSE_COALESCE_WINDOW = float(os.getenv("SSE_COALESCE_MS", "50")) / 1000
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT_S", "15"))
+flights = SingleFlight()
+session_store = create_session_store(os.getenv("SESSION_STORE", "memory"), os.getenv("SESSION_DB_PATH", "sessions.db"))
 
 # Enable CORS
 app.add_middleware(
@@ -34,9 +107,45 @@ def get_real_ip(request: Request) -> str:
         return x_forwarded_for.split(",")[0].strip()
     return request.client.host  # fallback if no header
 
-limiter = Limiter(key_func=get_real_ip)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+async def load_session(session_id: str, chat_id: str, chat_history: Optional[List[Message]], rules_list: Optional[List[Rule]]) -> tuple[HistoryWindow, List[str]]:
+    stored_rules = await session_store.aget_rules(session_id)
+    if rules_list is not None:
+        rules = [rule.title for rule in rules_list]
+        # Full payloads refresh the server-side copy, only written when it changed
+        if rules != stored_rules:
+            await session_store.aset_rules(session_id, rules)
+    elif stored_rules is None:
+        raise UnknownSession(session_id, chat_id)
+    else:
+        rules = stored_rules
+
+    stored_history = await session_store.aget_history(session_id, chat_id)
+    if chat_history is not None:
+        history = HistoryWindow(agent.format_chat_history(chat_history))
+        if stored_history is not None and list(stored_history) == list(history):
+            # Keep the summary folded turn by turn, the one rebuilt from the payload may differ
+            history = stored_history
+        else:
+            await session_store.aset_history(session_id, chat_id, history)
+    elif stored_history is None:
+        raise UnknownSession(session_id, chat_id)
+    else:
+        history = stored_history
+
+    return history, rules
+
+def capture_request(endpoint: str, payload):
+    if capture_log is not None:
+        capture_log.record_request(endpoint, payload)
+
+# Buckets live in a SQLite file when several workers must share the same limits
+limiter = RateLimiter(
+    key_func=get_real_ip,
+    backend=create_rate_limit_backend(os.getenv("RATE_LIMIT_STORE", "memory"), os.getenv("RATE_LIMIT_DB_PATH", "rate_limits.db")),
+)
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
+app.add_exception_handler(AdmissionRejected, admission_rejected_handler)
+app.add_exception_handler(UnknownSession, unknown_session_handler)
 
 @app.get("/")
 async def read_root():
@@ -47,41 +156,119 @@ async def get_rules():
     llm_rules = agent.get_initial_rules()
     return [Rule(id=i, title=rule, description=rule) for i, rule in enumerate(llm_rules)]
 
-@app.post("/api/new-rule", response_model=Rule)
-@limiter.limit("42/minute")
+@app.post("/api/new-rule", response_model=Rule, dependencies=[Depends(limiter.limit("42/minute"))])
 async def get_new_rule(rule_request: NewRuleRequest, request: Request):
-    rules = [rule.title for rule in rule_request.rules_list]
-    new_rule = agent.get_new_rule(rule_request.session_id, rule_request.chat_history, rules)
+    REQUEST_PRIORITY.set("new-rule")
+    capture_request("/api/new-rule", rule_request)
+    history, rules = await load_session(rule_request.session_id, rule_request.chat_id, rule_request.chat_history, rule_request.rules_list)
+    new_rule = await agent.aget_new_rule(rule_request.session_id, history, rules)
+    await session_store.aset_rules(rule_request.session_id, [new_rule] + rules)
     return Rule(id=0, title=new_rule, description=new_rule)
 
-@app.post("/api/chat", response_model=ChatResponse)
-@limiter.limit("42/minute")
+@app.post("/api/chat", response_model=ChatResponse, dependencies=[Depends(limiter.limit("42/minute"))])
 async def chat(chat_request: ChatRequest, request: Request):
-    rules = [rule.title for rule in chat_request.rules_list]
-    response, is_done, is_password_attempt = agent.process_message(chat_request.message.text, chat_request.chat_history, rules, chat_request.session_id)
-    return ChatResponse(message=response, is_done=is_done, is_password_attempt=is_password_attempt)
+    REQUEST_PRIORITY.set("chat")
+    capture_request("/api/chat", chat_request)
 
-@app.post("/api/chat-stream")
-@limiter.limit("42/minute")
+    async def answer():
+        history, rules = await load_session(chat_request.session_id, chat_request.chat_id, chat_request.chat_history, chat_request.rules_list)
+        response, is_done, is_password_attempt = await agent.aprocess_message(chat_request.message.text, history, rules, chat_request.session_id)
+        await session_store.arecord_turn(chat_request.session_id, chat_request.chat_id, chat_request.message.text, response)
+        return ChatResponse(message=response, is_done=is_done, is_password_attempt=is_password_attempt)
+
+    # Retries and double-clicks of a turn still in progress wait for the same answer
+    return await flights.do(chat_request_key("chat", chat_request), answer)
+
+@app.post("/api/chat-stream", dependencies=[Depends(limiter.limit("42/minute"))])
 async def stream(chat_request: ChatRequest, request: Request):
-    rules = [rule.title for rule in chat_request.rules_list]
-    def generate():
-        for chunk, is_done, is_password_attempt in agent.stream_message(chat_request.message.text, chat_request.chat_history, rules, chat_request.session_id):
-            yield f"data: {json.dumps({'message': chunk, 'is_done': is_done, 'is_password_attempt': is_password_attempt})}\n\n"
-    
+    REQUEST_PRIORITY.set("chat-stream")
+    capture_request("/api/chat-stream", chat_request)
+    history, rules = await load_session(chat_request.session_id, chat_request.chat_id, chat_request.chat_history, chat_request.rules_list)
+    start = time.perf_counter()
+    flags = {"is_done": False, "is_password_attempt": agent.is_password_attempt(chat_request.message.text)}
+
+    async def recorded():
+        chunks = await agent.aopen_stream(chat_request.message.text, history, rules, chat_request.session_id)
+
+        async def recording():
+            response = ""
+            async for chunk, is_done, is_password_attempt in chunks:
+                response += chunk
+                yield chunk, is_done
+            await session_store.arecord_turn(chat_request.session_id, chat_request.chat_id, chat_request.message.text, response)
+
+        return recording()
+
+    # Identical requests in flight share one answer, late ones get it replayed from the start.
+    # Only admission is decided here: a full queue is answered with 503, waiting happens inside the stream
+    answer = await flights.stream(chat_request_key("stream", chat_request), recorded)
+
+    async def chunks():
+        first = True
+        async for chunk, is_done in answer:
+            if first:
+                TIME_TO_FIRST_CHUNK.observe(time.perf_counter() - start, level=min(len(rules), MAX_LEVEL))
+                first = False
+            flags["is_done"] = is_done
+            yield chunk
+
+    async def generate():
+        async for chunk in chunks():
+            yield f"data: {json.dumps({'message': chunk, **flags})}\n\n"
+
+    if chat_request.stream_mode == "compact":
+        events = compact_events(
+            chunks(),
+            header={"is_password_attempt": flags["is_password_attempt"]},
+            trailer=flags,
+            max_chars=SSE_COALESCE_CHARS,
+            max_wait=SSE_COALESCE_WINDOW,
+            heartbeat=SSE_HEARTBEAT,
+        )
+        return StreamingResponse(events, media_type="text/event-stream")
     return StreamingResponse(generate(), media_type="text/event-stream")
 
 @app.get("/api/reset-game")
-async def reset_game():
-    agent.reset_game()
+async def reset_game(session_id: str):
+    await agent.areset_game(session_id)
+    # Delta clients reusing the id must start over from the initial rules
+    await session_store.aclear(session_id)
     return {"message": "Game reset successfully"}
 
 
-@app.get("/limit-test")
-@limiter.limit("10/minute")
+@app.get("/api/speculation")
+async def speculation_stats():
+    return {
+        "enabled": agent.model.speculative,
+        "runs": agent.model.speculative_runs,
+        "wasted": agent.model.speculative_wasted,
+    }
+
+
+@app.get("/api/guard-cache")
+async def guard_cache_stats():
+    return {
+        "input_guard": agent.model.input_guard.cache.stats(),
+        "output_guard": agent.model.output_guard.cache.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    SPECULATIVE_GENERATIONS.set(agent.model.speculative_runs, outcome="started")
+    SPECULATIVE_GENERATIONS.set(agent.model.speculative_wasted, outcome="wasted")
+    for guard_name, guard in (("input_guard", agent.model.input_guard), ("output_guard", agent.model.output_guard)):
+        GUARD_CACHE_LOOKUPS.set(guard.cache.hits, guard=guard_name, result="hit")
+        GUARD_CACHE_LOOKUPS.set(guard.cache.misses, guard=guard_name, result="miss")
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/limit-test", dependencies=[Depends(limiter.limit("10/minute"))])
 def test(request: Request):
     return {"message": "Hello"}
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    # RELOAD=true for development, the reloader forks a watcher and slows down every start
+    reload = os.getenv("RELOAD", "false").lower() == "true"
+    uvicorn.run("main:app" if reload else app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")), reload=reload) 
\ No newline at end of file
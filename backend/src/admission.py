@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from src.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTIONS, ADMISSION_WAIT
+from src.providers import parse_role_settings
+
+# Queued requests are served lowest first, then in arrival order
+PRIORITIES = {"chat-stream": 0, "chat": 1, "new-rule": 2}
+# Set by each endpoint, read where the request finally needs a provider
+REQUEST_PRIORITY: ContextVar[str] = ContextVar("request_priority", default="chat")
+
+# Requests in flight and requests queued behind them, per provider
+DEFAULT_ADMISSION_LIMITS = {"groq": (32, 64), "router": (32, 64), "ollama": (2, 16), "fake": (64, 256)}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Too many requests waiting for {provider}, try again later")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounds the requests one provider works on at a time.
+
+    Up to max_concurrent requests hold a slot; the next max_queue wait for one,
+    by PRIORITIES and then arrival order. Beyond that reserve() and slot() fail at once with
+    AdmissionRejected instead of queueing into a provider timeout.
+    """
+
+    def __init__(self, provider: str, max_concurrent: int, max_queue: int):
+        self.provider = provider
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiters = []
+        self._order = itertools.count()
+        # Moving average of how long a slot is held, for Retry-After
+        self.hold_time = 1.0
+
+    def reserve(self, priority: Optional[str] = None) -> "Reservation":
+        """Take a slot or a place in the queue right now; raises AdmissionRejected when the queue is full.
+
+        The place is only waited for when the reservation is entered with async with.
+        """
+        priority = priority or REQUEST_PRIORITY.get()
+        if self.in_flight < self.max_concurrent and not self.waiters:
+            self.in_flight += 1
+            self._export()
+            return Reservation(self, priority)
+        if len(self.waiters) >= self.max_queue:
+            ADMISSION_REJECTIONS.inc(provider=self.provider, priority=priority)
+            raise AdmissionRejected(self.provider, self.retry_after())
+
+        entry = (PRIORITIES[priority], next(self._order), asyncio.get_running_loop().create_future())
+        heapq.heappush(self.waiters, entry)
+        self._export()
+        return Reservation(self, priority, entry)
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None):
+        async with self.reserve(priority):
+            yield
+
+    def retry_after(self) -> float:
+        return max(1, math.ceil(self.hold_time * (len(self.waiters) + 1) / max(1, self.max_concurrent)))
+
+    async def _wait(self, entry: tuple):
+        try:
+            await entry[2]
+        except asyncio.CancelledError:
+            self._leave(entry)
+            raise
+
+    def _leave(self, entry: tuple):
+        if entry in self.waiters:
+            self.waiters.remove(entry)
+            heapq.heapify(self.waiters)
+            self._export()
+        elif not entry[2].cancelled():
+            # Handed a slot but never used it, pass it on
+            self._release()
+
+    def _release(self):
+        # The slot goes straight to the next waiter, so newcomers can't jump the queue
+        while self.waiters:
+            future = heapq.heappop(self.waiters)[2]
+            # Skip waiters cancelled but not yet woken up to leave the queue
+            if not future.done():
+                future.set_result(None)
+                self._export()
+                return
+        self.in_flight -= 1
+        self._export()
+
+    def _export(self):
+        ADMISSION_IN_FLIGHT.set(self.in_flight, provider=self.provider)
+        ADMISSION_QUEUE_DEPTH.set(len(self.waiters), provider=self.provider)
+
+
+class Reservation:
+    """A slot or a place in the queue of an AdmissionController, held until the async with block ends."""
+
+    def __init__(self, controller: AdmissionController, priority: str, entry: Optional[tuple] = None):
+        self.controller = controller
+        self.priority = priority
+        self.entry = entry
+        self.reserved_at = time.monotonic()
+        self.acquired_at = None
+
+    async def __aenter__(self):
+        if self.entry is not None:
+            await self.controller._wait(self.entry)
+        self.acquired_at = time.monotonic()
+        ADMISSION_WAIT.observe(self.acquired_at - self.reserved_at, provider=self.controller.provider, priority=self.priority)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        controller = self.controller
+        controller.hold_time = 0.8 * controller.hold_time + 0.2 * (time.monotonic() - self.acquired_at)
+        controller._release()
+
+
+def parse_admission_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """Parse "groq=32:64,ollama=2:16" into (max_concurrent, max_queue) per provider"""
+    limits = {}
+    for provider, value in parse_role_settings(spec).items():
+        max_concurrent, max_queue = value.split(":")
+        limits[provider] = (int(max_concurrent), int(max_queue))
+    return limits
+
+
+def create_admission_controller(provider: str, spec: Optional[str] = None) -> AdmissionController:
+    limits = {**DEFAULT_ADMISSION_LIMITS, **(parse_admission_limits(spec) if spec else {})}
+    return AdmissionController(provider, *limits.get(provider, DEFAULT_ADMISSION_LIMITS["groq"]))
+
+
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        {"error": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
@@ -1,81 +1,180 @@
 import random
 import traceback
-import re
-from typing import List, Generator
+from typing import AsyncGenerator, AsyncIterator, Generator, Iterable, List, Optional
 
-from src.models import GroqModel, OllamaModel
+from src.admission import AdmissionController, Reservation, create_admission_controller
+from src.models import DEFAULT_BACKENDS, FakeModel, GroqModel, OllamaModel, RouterModel
+from src.passwords import PASSWORDS
+from src.prefilters import PrefilterResult, extract_first_capitalized_word
+from src.prompts import RESPONSES
+from src.providers import make_role_models, parse_backends, parse_role_settings
+from src.rule_store import RuleStore
 from src.schemas import Message
+from src.session_store import HistoryWindow, append_turn
 
 
 class Agent:
-    def __init__(self, model_type: str = "groq"):
+    def __init__(self, model_type: str = "groq", speculative: bool = False, rule_store: RuleStore = None, backends: Optional[str] = None,
+                 role_models: Optional[str] = None, role_max_tokens: Optional[str] = None, history_budgets: Optional[str] = None,
+                 admission: Optional[AdmissionController] = None, hedge_percentile: Optional[float] = None):
+        # Per-role overrides, e.g. a small model for the guards
+        roles = {
+            "role_llms": make_role_models(role_models) if role_models else None,
+            "max_tokens": {role: int(n) for role, n in parse_role_settings(role_max_tokens).items()} if role_max_tokens else None,
+        }
         if model_type == "groq":
-            self.model = GroqModel(model_name="meta-llama/llama-4-scout-17b-16e-instruct", thinking=True)
+            self.model = GroqModel(model_name="meta-llama/llama-4-scout-17b-16e-instruct", thinking=True, speculative=speculative, rule_store=rule_store, **roles)
         elif model_type == "ollama":
-            self.model = OllamaModel(model_name="llama3.2:1b", thinking=True)
+            self.model = OllamaModel(model_name="llama3.2:1b", thinking=True, speculative=speculative, rule_store=rule_store, **roles)
+        elif model_type == "router":
+            # Latency percentile after which a call is hedged on the next backend
+            router = {"hedge_percentile": hedge_percentile} if hedge_percentile is not None else {}
+            self.model = RouterModel(backends=parse_backends(backends) if backends else DEFAULT_BACKENDS, thinking=True, speculative=speculative, rule_store=rule_store, **router, **roles)
+        elif model_type == "fake":
+            self.model = FakeModel(speculative=speculative, rule_store=rule_store)
+
+        if history_budgets:
+            self.model.history_budgets.update({role: int(n) for role, n in parse_role_settings(history_budgets).items()})
+
+        # Only turns that reach the provider take a slot, pre-filtered ones never wait
+        self.admission = admission if admission is not None else create_admission_controller(model_type)
 
     def get_initial_rules(self) -> List[str]:
         return [self.model.llm_rules[0]]
 
-    def process_message(self, message: str, chat_history: List[Message], rules: List[str], game_session_id: str) -> tuple[str, bool]:
-        first_capitalized_word = self.extract_first_capitalized_word(message)
-        is_password_attempt = first_capitalized_word != None and len(first_capitalized_word) > 2
+    def process_message(self, message: str, chat_history: List[Message], rules: List[str], game_session_id: str) -> tuple[str, bool, bool]:
+        is_password_attempt = self.is_password_attempt(message)
+        password = self.get_password(game_session_id, rules)
+        history = HistoryWindow(self.format_chat_history(chat_history))
 
-        # Check for password anywhere in message
+        prefiltered = self.model.prefilters.run(message, password, history, len(rules))
+        if prefiltered is not None:
+            return prefiltered.response, prefiltered.is_done, is_password_attempt
+
+        response = self.model.lookup_response(message, password, history, rules, game_session_id)
+        if response is None:
+            response = self.model.build_message(message, password, history, rules, game_session_id)
+        return response, False, is_password_attempt
+
+    async def aprocess_message(self, message: str, chat_history: List[Message], rules: List[str], game_session_id: str) -> tuple[str, bool, bool]:
+        is_password_attempt = self.is_password_attempt(message)
         password = self.get_password(game_session_id, rules)
-        if first_capitalized_word == password:
-            return self.model.build_congratulations(), True, is_password_attempt
+        history = HistoryWindow(self.format_chat_history(chat_history))
+
+        prefiltered = self.model.prefilters.run(message, password, history, len(rules))
+        if prefiltered is not None:
+            if prefiltered.is_done:
+                self._pregenerate_rule(message, prefiltered.response, history, rules, game_session_id)
+            return prefiltered.response, prefiltered.is_done, is_password_attempt
 
-        response = self.model.build_message(message, password, chat_history, rules)
+        # Cached answers need no provider slot
+        response = await self.model.alookup_response(message, password, history, rules, game_session_id)
+        if response is None:
+            async with self.admission.slot():
+                response = await self.model.abuild_message(message, password, history, rules, game_session_id)
         return response, False, is_password_attempt
 
-    def stream_message(self, message: str, chat_history: List[Message], rules: List[str], game_session_id: str) -> Generator[tuple[str, bool]]:
-        first_capitalized_word = self.extract_first_capitalized_word(message)
-        is_password_attempt = first_capitalized_word != None and len(first_capitalized_word) > 2
-        
-        # Check for password anywhere in message
+    def stream_message(self, message: str, chat_history: List[Message], rules: List[str], game_session_id: str) -> Generator[tuple[str, bool, bool], None, None]:
+        is_password_attempt = self.is_password_attempt(message)
         password = self.get_password(game_session_id, rules)
-        if first_capitalized_word == password:
-            for chunk in self.model.stream_congratulations():
-                yield (chunk, True, is_password_attempt)
+        history = HistoryWindow(self.format_chat_history(chat_history))
+
+        prefiltered = self.model.prefilters.run(message, password, history, len(rules))
+        if prefiltered is not None:
+            for chunk in self._stream_prefiltered(prefiltered):
+                yield (chunk, prefiltered.is_done, is_password_attempt)
+            return
+
+        cached = self.model.lookup_response(message, password, history, rules, game_session_id)
+        if cached is not None:
+            for chunk in self.model.stream_text(cached):
+                yield (chunk, False, is_password_attempt)
 
         else:
             try:
-                for chunk in self.model.stream_message(message, password, chat_history, rules):
+                for chunk in self.model.stream_message(message, password, history, rules, game_session_id):
                     yield (chunk, False, is_password_attempt)
                 
-            except Exception as e:
-                error_message = f"Error processing message: {str(e)} \n\n {traceback.format_exc()}"
-                words = error_message.split()
-                for word in words:
-                    yield (word, False, is_password_attempt)
+            except Exception:
+                traceback.print_exc()
+                yield (RESPONSES["provider_error"], False, is_password_attempt)
+    
+    async def aopen_stream(self, message: str, chat_history: List[Message], rules: List[str], game_session_id: str) -> AsyncIterator[tuple[str, bool, bool]]:
+        """Decide how the turn is answered and return its chunks.
+
+        A provider slot is reserved here, so a full queue raises AdmissionRejected
+        before any chunk; waiting for the slot happens while the chunks are read.
+        """
+        is_password_attempt = self.is_password_attempt(message)
+        password = self.get_password(game_session_id, rules)
+        history = HistoryWindow(self.format_chat_history(chat_history))
+
+        prefiltered = self.model.prefilters.run(message, password, history, len(rules))
+        if prefiltered is not None:
+            if prefiltered.is_done:
+                self._pregenerate_rule(message, prefiltered.response, history, rules, game_session_id)
+            return self._tagged(self._stream_prefiltered(prefiltered), prefiltered.is_done, is_password_attempt)
+
+        cached = await self.model.alookup_response(message, password, history, rules, game_session_id)
+        if cached is not None:
+            return self._tagged(self.model.stream_text(cached), False, is_password_attempt)
+
+        reservation = self.admission.reserve()
+        return self._astream_model(reservation, message, password, history, rules, game_session_id, is_password_attempt)
+
+    async def _tagged(self, chunks: Iterable[str], is_done: bool, is_password_attempt: bool) -> AsyncGenerator[tuple[str, bool, bool], None]:
+        for chunk in chunks:
+            yield (chunk, is_done, is_password_attempt)
+
+    async def _astream_model(self, reservation: Reservation, message: str, password: str, history: HistoryWindow, rules: List[str],
+                             game_session_id: str, is_password_attempt: bool) -> AsyncGenerator[tuple[str, bool, bool], None]:
+        async with reservation:
+            try:
+                async for chunk in self.model.astream_message(message, password, history, rules, game_session_id):
+                    yield (chunk, False, is_password_attempt)
+
+            except Exception:
+                traceback.print_exc()
+                yield (RESPONSES["provider_error"], False, is_password_attempt)
+
+    def _pregenerate_rule(self, message: str, response: str, history: HistoryWindow, rules: List[str], game_session_id: str):
+        # Same window /api/new-rule will load once this winning turn is recorded
+        history = append_turn(history, message, response)
+        self.model.pregenerate_rule(history, rules, self.get_password(game_session_id, rules), game_session_id, admission=self.admission)
+
+    def _stream_prefiltered(self, prefiltered: PrefilterResult) -> Generator[str, None, None]:
+        if prefiltered.is_done:
+            yield from self.model.stream_congratulations()
+        else:
+            yield prefiltered.response
     
     def get_new_rule(self, session_id: str, chat_history: List[Message], rules: List[str]):
         password = self.get_password(session_id, rules)
-        return self.model.get_new_rule(chat_history, rules, password)
+        return self.model.get_new_rule(chat_history, rules, password, session_id)
+
+    async def aget_new_rule(self, session_id: str, chat_history: List[Message], rules: List[str]):
+        password = self.get_password(session_id, rules)
+        return await self.model.aget_new_rule(chat_history, rules, password, session_id, admission=self.admission)
+
+    def format_chat_history(self, chat_history: List[Message]) -> List[dict]:
+        return self.model._format_chat_history(chat_history)
 
     def extract_first_capitalized_word(self, message: str) -> str:
-        matches = re.findall(r'\b[A-Z]+\b', message)
-        if matches:
-            return matches[0]
-        return None
+        return extract_first_capitalized_word(message)
+
+    def is_password_attempt(self, message: str) -> bool:
+        first_capitalized_word = self.extract_first_capitalized_word(message)
+        return first_capitalized_word != None and len(first_capitalized_word) > 2
 
     def get_password(self, session_id: str, rules: List[str]):
         """Fetch password for the current session"""
-        password_choices = [
-            "password", "cat", "mouse", "dog", "bird", "fish", "horse", "rabbit", 
-            "snake", "tiger", "lion", "elephant", "giraffe", "zebra", "penguin", 
-            "koala", "kangaroo", "panda", "bear", "fox", "wolf", "cat", "dog", 
-            "bird", "fish", "horse", "rabbit", "snake", "tiger", "lion", "elephant", 
-            "giraffe", "zebra", "penguin", "koala", "panda", "bear", "fox", "wolf"
-        ]
-
-        passowrd_index = (int(session_id) + len(rules)) % len(password_choices)
-        password = password_choices[passowrd_index].upper()
-        print(f"Password for session {session_id}: {password}")
-        return password
-
-    def reset_game(self):
-        self.model.reset_game()
+        password_index = (int(session_id) + len(rules)) % len(PASSWORDS)
+        return PASSWORDS[password_index]
+
+    def reset_game(self, session_id: str = None):
+        self.model.reset_game(session_id)
+
+    async def areset_game(self, session_id: str = None):
+        await self.model.areset_game(session_id)
 
     
@@ -0,0 +1,112 @@
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import SystemMessage
+
+from src.metrics import GUARD_BATCH_SIZE
+
+VERDICT_LINE = re.compile(r'^\s*(\d+)\s*[:.)-]\s*(safe|unsafe)\s*$', re.IGNORECASE)
+# Item delimiters a user could write to close their item early and open a fake one
+ITEM_TAG = re.compile(r'<\s*/?\s*item\b[^>]*>', re.IGNORECASE)
+
+
+class MicroBatcher:
+    """Collects concurrent submissions for a short window and processes them together.
+
+    A batch is sent when `max_wait` seconds have passed since its first item or
+    when it reaches `max_batch_size`, whichever comes first. Each caller gets
+    back its own result, or the exception the batch raised.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], Awaitable[List[Any]]], max_batch_size: int = 8, max_wait: float = 0.005):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: List[tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[tuple[Any, asyncio.Future]]):
+        GUARD_BATCH_SIZE.observe(len(batch))
+        try:
+            results = await self.process_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def build_batch_prompt(prompt_template: str, items: List[dict]) -> str:
+    sections = [
+        f"<ITEM {number}>\n{ITEM_TAG.sub('', prompt_template.format(**inputs))}\n</ITEM {number}>"
+        for number, inputs in enumerate(items, start=1)
+    ]
+    return "\n\n".join(sections) + (
+        f"\n\nEach ITEM above is a separate, independent classification task. "
+        f"Respond with exactly {len(items)} lines, one per ITEM in order, in the form "
+        f"\"<item number>: safe\" or \"<item number>: unsafe\". Do not explain."
+    )
+
+
+def parse_batch_verdicts(text: str, count: int) -> List[Optional[bool]]:
+    """Verdict per item, all None when the answer can't be trusted.
+
+    Repeated item numbers or more verdict lines than items mean the model
+    followed instructions smuggled into an item, so every item is retried alone.
+    """
+    verdicts: List[Optional[bool]] = [None] * count
+    matches = [match for match in map(VERDICT_LINE.match, text.splitlines()) if match]
+    numbers = [int(match.group(1)) for match in matches]
+    if len(matches) > count or len(set(numbers)) < len(numbers):
+        return verdicts
+    for number, match in zip(numbers, matches):
+        if 1 <= number <= count:
+            verdicts[number - 1] = match.group(2).lower() == "safe"
+    return verdicts
+
+
+async def classify_batch(llm: BaseChatModel, prompt_template: str, items: List[dict], classify_one: Callable[[dict], Awaitable[bool]]) -> List[bool]:
+    """Run several guard classifications as one provider request.
+
+    A batch of one uses the normal single-item prompt. Items the model did not
+    answer in the expected format are retried one by one.
+    """
+    if len(items) == 1:
+        return [await classify_one(items[0])]
+
+    response = await llm.ainvoke([SystemMessage(content=build_batch_prompt(prompt_template, items))])
+    verdicts = parse_batch_verdicts(response.content, len(items))
+
+    missing = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    if missing:
+        retried = await asyncio.gather(*(classify_one(items[i]) for i in missing))
+        for i, verdict in zip(missing, retried):
+            verdicts[i] = verdict
+    return verdicts
@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from pydantic import BaseModel
+
+from src.cache import hash_key
+from src.passwords import PASSWORDS
+
+
+def prompt_key(messages: List[BaseMessage]) -> str:
+    return hash_key(*(f"{message.type}:{message.content}" for message in messages))
+
+
+class CaptureLog:
+    """Append-only JSON lines of requests and LLM calls, for offline replay.
+
+    Session and chat ids are replaced by salted hashes. A session id keeps
+    its remainder modulo the number of passwords, so a replayed game draws
+    the same passwords and sends the same prompts as the captured one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.salt = os.urandom(8).hex()
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, kind: str, **fields):
+        line = json.dumps({"t": round(time.time(), 4), "kind": kind, **fields}, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def record_request(self, endpoint: str, payload: BaseModel):
+        body = payload.model_dump(exclude_none=True)
+        body["session_id"] = self.anonymize_session_id(body["session_id"])
+        if body.get("chat_id"):
+            body["chat_id"] = hash_key(self.salt, body["chat_id"])[:16]
+        self.record("request", endpoint=endpoint, body=body)
+
+    def anonymize_session_id(self, session_id: str) -> str:
+        count = len(PASSWORDS)
+        hashed = int(hash_key(self.salt, session_id)[:12], 16)
+        return str(hashed // count * count + int(session_id) % count)
+
+    def close(self):
+        self._file.close()
+
+
+class CaptureCallback(BaseCallbackHandler):
+    """Records every chat model call: its prompt, answer and timing."""
+
+    # Called in the event loop, in order, rather than from executor threads
+    run_inline = True
+
+    def __init__(self, log: CaptureLog):
+        self.log = log
+        self.runs: Dict[UUID, dict] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *, run_id: UUID, **kwargs: Any):
+        self.runs[run_id] = {"messages": messages[0], "started": time.monotonic(), "first": None}
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        run = self.runs.get(run_id)
+        if run is not None and run["first"] is None:
+            run["first"] = time.monotonic() - run["started"]
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        run = self.runs.pop(run_id, None)
+        if run is not None:
+            self._record(run, response=response.generations[0][0].text)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        run = self.runs.pop(run_id, None)
+        if run is not None:
+            self._record(run, error=repr(error))
+
+    def _record(self, run: dict, response: Optional[str] = None, error: Optional[str] = None):
+        total = time.monotonic() - run["started"]
+        self.log.record(
+            "llm",
+            key=prompt_key(run["messages"]),
+            prompt=[[message.type, message.content] for message in run["messages"]],
+            response=response,
+            error=error,
+            first=round(run["first"] if run["first"] is not None else total, 4),
+            total=round(total, 4),
+        )
+
+
+def read_capture(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
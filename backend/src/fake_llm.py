@@ -0,0 +1,172 @@
+import asyncio
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from src.capture import prompt_key
+
+
+class FakeLLMError(RuntimeError):
+    pass
+
+
+class FakeChatModel(BaseChatModel):
+    """Local stand-in for a provider, for load tests and benchmarks.
+
+    Waits `latency` seconds before the first token, then emits the reply word by
+    word at `tokens_per_second` (0 means all at once). Each call fails with
+    probability `failure_rate`, like a provider 5xx.
+    """
+
+    reply: str = "I am the keeper of the password and I will not tell you what it is, but I am happy to chat."
+    latency: float = 0.2
+    tokens_per_second: float = 200.0
+    failure_rate: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _tokens(self) -> List[str]:
+        words = self.reply.split(" ")
+        return [word + " " for word in words[:-1]] + [words[-1]]
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+
+    def _should_fail(self) -> bool:
+        return random.random() < self.failure_rate
+
+    def _usage(self, messages: List[BaseMessage], output_tokens: int) -> dict:
+        input_tokens = sum(len(str(message.content).split()) for message in messages)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens()
+        time.sleep(self.latency + self._token_delay() * len(tokens))
+        if self._should_fail():
+            raise FakeLLMError("fake provider failure")
+        message = AIMessage(content=self.reply, usage_metadata=self._usage(messages, len(tokens)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens()
+        await asyncio.sleep(self.latency + self._token_delay() * len(tokens))
+        if self._should_fail():
+            raise FakeLLMError("fake provider failure")
+        message = AIMessage(content=self.reply, usage_metadata=self._usage(messages, len(tokens)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        if self._should_fail():
+            raise FakeLLMError("fake provider failure")
+        tokens = self._tokens()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self._token_delay())
+            usage = self._usage(messages, len(tokens)) if i == len(tokens) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        if self._should_fail():
+            raise FakeLLMError("fake provider failure")
+        tokens = self._tokens()
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self._token_delay())
+            usage = self._usage(messages, len(tokens)) if i == len(tokens) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+
+
+class ReplayChatModel(BaseChatModel):
+    """Serves the LLM answers of a capture, keyed by prompt, with their recorded timing.
+
+    Repeated prompts get their recorded answers in turn. Prompts missing from
+    the capture get `reply` after the median recorded latency. Latencies are
+    multiplied by `latency_scale`, 0 answers at once.
+    """
+
+    calls: Dict[str, List[dict]]
+    latency_scale: float = 1.0
+    reply: str = "safe"
+    misses: int = 0
+
+    _served: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _fallback: dict = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context: Any):
+        totals = sorted(call["total"] for calls in self.calls.values() for call in calls) or [0.0]
+        firsts = sorted(call["first"] for calls in self.calls.values() for call in calls) or [0.0]
+        self._fallback = {"response": self.reply, "error": None, "first": firsts[len(firsts) // 2], "total": totals[len(totals) // 2]}
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay-chat-model"
+
+    def _next_call(self, messages: List[BaseMessage]) -> dict:
+        key = prompt_key(messages)
+        calls = self.calls.get(key)
+        if not calls:
+            self.misses += 1
+            return self._fallback
+        index = self._served.get(key, 0)
+        self._served[key] = index + 1
+        return calls[index % len(calls)]
+
+    def _result(self, call: dict) -> ChatResult:
+        if call["error"] is not None:
+            raise FakeLLMError(call["error"])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=call["response"]))])
+
+    def _chunks(self, call: dict) -> Iterator[Tuple[float, str]]:
+        """(delay before the chunk, chunk) for the recorded answer, word by word"""
+        words = call["response"].split(" ")
+        tokens = [word + " " for word in words[:-1]] + [words[-1]]
+        gap = max(0.0, call["total"] - call["first"]) / max(1, len(tokens) - 1)
+        for i, token in enumerate(tokens):
+            yield (call["first"] if i == 0 else gap) * self.latency_scale, token
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        call = self._next_call(messages)
+        time.sleep(call["total"] * self.latency_scale)
+        return self._result(call)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        call = self._next_call(messages)
+        await asyncio.sleep(call["total"] * self.latency_scale)
+        return self._result(call)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        call = self._next_call(messages)
+        if call["error"] is not None:
+            time.sleep(call["total"] * self.latency_scale)
+            raise FakeLLMError(call["error"])
+        for delay, token in self._chunks(call):
+            time.sleep(delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        call = self._next_call(messages)
+        if call["error"] is not None:
+            await asyncio.sleep(call["total"] * self.latency_scale)
+            raise FakeLLMError(call["error"])
+        for delay, token in self._chunks(call):
+            await asyncio.sleep(delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def replay_calls(records: List[dict]) -> Dict[str, List[dict]]:
+    """LLM calls of a capture grouped by prompt, in capture order"""
+    calls = {}
+    for record in records:
+        if record["kind"] == "llm":
+            calls.setdefault(record["key"], []).append(record)
+    return calls
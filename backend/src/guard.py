@@ -0,0 +1,60 @@
+from functools import partial
+from typing import Iterable, List, Optional
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.language_models import BaseChatModel
+
+from src.batching import MicroBatcher, classify_batch
+from src.cache import TTLCache
+from src.providers import limit_tokens
+
+
+class LLMGuard:
+    """Shared LLM side of the input and output guards: one chain per prompt, verdict cache and batching."""
+
+    def __init__(self, llm: BaseChatModel, cache: Optional[TTLCache] = None, max_tokens: Optional[int] = None,
+                 prompt_templates: Iterable[str] = ()):
+        self.llm = llm
+        # Verdicts are a single word, so the model is cut off right after it
+        self.max_tokens = max_tokens
+        # LLM verdicts keyed by prompt and input, so retries don't pay for a new classification
+        self.cache = cache if cache is not None else TTLCache()
+        self.batch_window = 0
+        self.max_batch_size = 8
+        self.batchers = {}
+        self.chains = {prompt_template: self._build_chain(prompt_template) for prompt_template in prompt_templates}
+
+    def enable_batching(self, batch_window: float, max_batch_size: int = 8):
+        """Group concurrent LLM checks arriving within batch_window seconds into one request"""
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.batchers = {}
+
+    async def _aclassify(self, prompt_template: str, inputs: dict) -> bool:
+        response = await self._get_chain(prompt_template).ainvoke(inputs)
+        return response.content == "safe"
+
+    def _get_batcher(self, prompt_template: str) -> MicroBatcher:
+        batcher = self.batchers.get(prompt_template)
+        if batcher is None:
+            batcher = self.batchers[prompt_template] = MicroBatcher(
+                partial(self._aclassify_batch, prompt_template), self.max_batch_size, self.batch_window
+            )
+        return batcher
+
+    async def _aclassify_batch(self, prompt_template: str, items: List[dict]) -> List[bool]:
+        # One numbered verdict line per item
+        max_tokens = (self.max_tokens + 4) * len(items) if self.max_tokens is not None else None
+        return await classify_batch(limit_tokens(self.llm, max_tokens), prompt_template, items, partial(self._aclassify, prompt_template))
+
+    def _get_chain(self, prompt_template: str):
+        chain = self.chains.get(prompt_template)
+        if chain is None:
+            chain = self.chains[prompt_template] = self._build_chain(prompt_template)
+        return chain
+
+    def _build_chain(self, prompt_template: str):
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", prompt_template)
+        ])
+        return prompt | limit_tokens(self.llm, self.max_tokens)
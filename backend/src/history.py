@@ -0,0 +1,58 @@
+import math
+import re
+from typing import List
+
+SUMMARY_ROLE = "summary"
+# Prompt tokens each role may spend on history, summary included
+DEFAULT_HISTORY_BUDGETS = {"chat": 1024, "input_guard": 512, "rule": 1024}
+SUMMARY_MAX_CHARS = 1200
+SUMMARY_LINE_CHARS = 160
+# Role and separators around every message in the rendered prompt
+MESSAGE_OVERHEAD_TOKENS = 8
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count, about four characters per token for English text"""
+    return math.ceil(len(text) / 4)
+
+
+def summarize_message(message: dict) -> str:
+    """Extractive one-liner: who spoke and their first sentence"""
+    first_sentence = SENTENCE_END.split(message["content"].strip(), 1)[0]
+    if len(first_sentence) > SUMMARY_LINE_CHARS:
+        first_sentence = first_sentence[:SUMMARY_LINE_CHARS - 3] + "..."
+    return f"{message['role']}: {first_sentence}"
+
+
+def fold_summary(summary: str, messages: List[dict], max_chars: int = SUMMARY_MAX_CHARS) -> str:
+    """Add messages to a rolling summary, dropping its oldest lines beyond max_chars"""
+    lines = summary.splitlines() if summary else []
+    lines += [summarize_message(message) for message in messages]
+    size = sum(len(line) + 1 for line in lines)
+    while lines and size > max_chars:
+        size -= len(lines.pop(0)) + 1
+    return "\n".join(lines)
+
+
+def fit_history(messages: List[dict], summary: str, budget: int) -> List[dict]:
+    """Newest messages that fit in budget tokens, with everything older folded into the summary"""
+    # The summary never takes more than half the budget
+    summary = fold_summary(summary, [], max_chars=min(SUMMARY_MAX_CHARS, budget * 2))
+    used = count_tokens(summary)
+    kept = 0
+    for message in reversed(messages):
+        cost = count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            break
+        used += cost
+        kept += 1
+
+    dropped = messages[:len(messages) - kept]
+    if dropped:
+        recent_tokens = used - count_tokens(summary)
+        summary = fold_summary(summary, dropped, max_chars=min(SUMMARY_MAX_CHARS, (budget - recent_tokens) * 4))
+    recent = messages[len(messages) - kept:]
+    return ([{"role": SUMMARY_ROLE, "content": summary}] if summary else []) + recent
+
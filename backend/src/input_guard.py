@@ -1,46 +1,122 @@
+import json
 import re
 from functools import partial
-from typing import Callable, List
+from typing import Awaitable, Callable, List, Optional
 
-from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.language_models import BaseChatModel
 
+from src.cache import TTLCache, hash_key
+from src.guard import LLMGuard
+from src.local_classifier import HashedNgramClassifier, VerdictLog
+from src.metrics import LOCAL_CLASSIFIER_VERDICTS
 from src.prompts import PROMPTS
 
+PASSWORD_MENTION = re.compile(r'\b(password)\b')
 
-class InputGuard:
-    def __init__(self, llm: BaseChatModel):
-        self.llm = llm
 
-    def get_checker(self, level: int) -> Callable[[str], bool]:
+class InputGuard(LLMGuard):
+    def __init__(self, llm: BaseChatModel, cache: Optional[TTLCache] = None,
+                 classifier: Optional[HashedNgramClassifier] = None, verdict_log: Optional[VerdictLog] = None,
+                 max_tokens: Optional[int] = None):
+        super().__init__(llm, cache, max_tokens, (PROMPTS["input_guard"], PROMPTS["input_guard_v2"]))
+        # Local first tier; only messages it is unsure about reach the LLM
+        self.classifier = classifier
+        self.verdict_log = verdict_log
+
+    def uses_llm(self, level: int) -> bool:
+        return level >= 5
+
+    def get_checker(self, level: int) -> Callable[[str, List[str]], bool]:
         if level < 4:
             return self.skip_check
         elif level == 4:
             return self.regex_check
         else:
             prompt_template = PROMPTS["input_guard"] if level == 5 else PROMPTS["input_guard_v2"]
-            return partial(self.llm_check, prompt_template=prompt_template)
+            return partial(self.llm_check, prompt_template=prompt_template, level=level)
+
+    def get_async_checker(self, level: int) -> Callable[[str, List[str]], Awaitable[bool]]:
+        if level < 4:
+            return self.askip_check
+        elif level == 4:
+            return self.aregex_check
+        else:
+            prompt_template = PROMPTS["input_guard"] if level == 5 else PROMPTS["input_guard_v2"]
+            return partial(self.allm_check, prompt_template=prompt_template, level=level)
 
     def skip_check(self, user_message: str, chat_history: List[str]) -> bool:
         return True
     
     def regex_check(self, user_message: str, chat_history: List[str]) -> bool:
-        pattern = r'\b(password)\b'
-        return not bool(re.search(pattern, user_message.lower()))
+        return not bool(PASSWORD_MENTION.search(user_message.lower()))
     
-    def llm_check(self, user_message: str, chat_history: List[str], prompt_template: str) -> bool:
+    def llm_check(self, user_message: str, chat_history: List[str], prompt_template: str, level: int = 5) -> bool:
         if not self.regex_check(user_message, chat_history):
             return False
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", prompt_template)
-        ])
+        is_safe = self._local_verdict(user_message, level)
+        if is_safe is not None:
+            return is_safe
+
+        cache_key = hash_key(prompt_template, self._normalize(user_message), json.dumps(chat_history, sort_keys=True))
+        is_safe = self.cache.get(cache_key)
+        if is_safe is not None:
+            return is_safe
 
-        chain = prompt | self.llm
+        chain = self._get_chain(prompt_template)
         response = chain.invoke({
             "chat_history": chat_history,
             "user_message": user_message
         })
 
-        return response.content == "safe"
-    
\ No newline at end of file
+        is_safe = response.content == "safe"
+        self._record_verdict(user_message, level, is_safe)
+        self.cache.set(cache_key, is_safe)
+        return is_safe
+
+    async def askip_check(self, user_message: str, chat_history: List[str]) -> bool:
+        return self.skip_check(user_message, chat_history)
+
+    async def aregex_check(self, user_message: str, chat_history: List[str]) -> bool:
+        return self.regex_check(user_message, chat_history)
+
+    async def allm_check(self, user_message: str, chat_history: List[str], prompt_template: str, level: int = 5) -> bool:
+        if not self.regex_check(user_message, chat_history):
+            return False
+
+        is_safe = self._local_verdict(user_message, level)
+        if is_safe is not None:
+            return is_safe
+
+        cache_key = hash_key(prompt_template, self._normalize(user_message), json.dumps(chat_history, sort_keys=True))
+        is_safe = self.cache.get(cache_key)
+        if is_safe is not None:
+            return is_safe
+
+        inputs = {
+            "chat_history": chat_history,
+            "user_message": user_message
+        }
+        if self.batch_window > 0:
+            is_safe = await self._get_batcher(prompt_template).submit(inputs)
+        else:
+            is_safe = await self._aclassify(prompt_template, inputs)
+
+        self._record_verdict(user_message, level, is_safe)
+        self.cache.set(cache_key, is_safe)
+        return is_safe
+
+    def _local_verdict(self, user_message: str, level: int) -> Optional[bool]:
+        if self.classifier is None:
+            return None
+        is_safe = self.classifier.classify(user_message, level)
+        verdict = "uncertain" if is_safe is None else ("safe" if is_safe else "unsafe")
+        LOCAL_CLASSIFIER_VERDICTS.inc(level=level, verdict=verdict)
+        return is_safe
+
+    def _record_verdict(self, user_message: str, level: int, is_safe: bool):
+        if self.verdict_log is not None:
+            self.verdict_log.record(user_message, level, is_safe)
+
+    def _normalize(self, user_message: str) -> str:
+        return " ".join(user_message.split()).casefold()
@@ -0,0 +1,192 @@
+import codecs
+import re
+from collections import deque
+from typing import Iterable, Iterator, List, Tuple
+
+from src.passwords import PASSWORDS
+
+LEAK = "leak"
+CLEAN = "clean"
+SUSPECT = "suspect"
+
+# Leetspeak and look-alike characters, folded the same way in passwords and text.
+# "l" and "i" share a slot so "1" can stand for either.
+FOLD = str.maketrans({**dict(zip("01345789@$+", "oieastbgast")), "l": "i", "L": "i"})
+LETTERS = re.compile(r"[a-z]+")
+# Long runs that could be base64 or hex rather than words
+ENCODED_TOKENS = re.compile(r"[A-Za-z0-9+/=]{8,}")
+
+
+class AhoCorasick:
+    """Automaton that finds every occurrence of a fixed set of words in one pass."""
+
+    def __init__(self, words: Iterable[str]):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output: List[List[str]] = [[]]
+        for word in set(words):
+            self._insert(word)
+        self._link()
+
+    def _insert(self, word: str):
+        state = 0
+        for char in word:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(word)
+
+    def _link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Yield (start, end, word) for every match"""
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for word in self.output[state]:
+                yield i + 1 - len(word), i + 1, word
+
+
+class LeakMatcher:
+    """Finds a password in model output, plain or obfuscated.
+
+    scan() returns LEAK for confident hits (the word in any case or in
+    leetspeak, or spelled out in separate letters), SUSPECT when the password
+    only shows up reversed, split across words or as an acrostic, or when the
+    text could carry it in another form: a word one typo or anagram away
+    ("tigre"), non-Latin letters, rot13 or base64/hex-looking tokens. Only
+    CLEAN is confident enough to skip the LLM guard.
+    """
+
+    def __init__(self, passwords: Iterable[str] = PASSWORDS):
+        self.automaton = AhoCorasick(fold(password) for password in passwords)
+
+    def scan(self, text: str, password: str) -> str:
+        target = fold(password)
+        folded = fold(text)
+        if self._has_word(folded, target):
+            return LEAK
+
+        words = [(m.start(), m.end()) for m in LETTERS.finditer(folded)]
+        if self._has_spelled_out(folded, words, target):
+            return LEAK
+
+        letters = "".join(folded[start:end] for start, end in words)
+        starts, ends = set(), set()
+        offset = 0
+        for start, end in words:
+            starts.add(offset)
+            offset += end - start
+            ends.add(offset)
+
+        # Split across words ("ca t"), reversed ("tac", "t a c") or as initials
+        if self._has_joined(letters, starts, ends, target):
+            return SUSPECT
+        if self._has_joined(letters[::-1], {offset - e for e in ends}, {offset - s for s in starts}, target):
+            return SUSPECT
+        initials = "".join(folded[start] for start, _ in words)
+        lines = "".join(line.strip()[0] for line in folded.splitlines() if line.strip())
+        if self._contains(initials, target) or self._contains(lines, target):
+            return SUSPECT
+
+        # Translated, misspelled or encoded forms the matcher can't rule out
+        if any(is_near_miss(folded[start:end], target) for start, end in words):
+            return SUSPECT
+        if looks_encoded(text) or self._has_word(fold(codecs.encode(text, "rot13")), target):
+            return SUSPECT
+        return CLEAN
+
+    def has_leak(self, text: str, password: str) -> bool:
+        return self.scan(text, password) == LEAK
+
+    def _matches(self, text: str, target: str) -> Iterator[Tuple[int, int]]:
+        for start, end, word in self.automaton.finditer(text):
+            if word == target:
+                yield start, end
+
+    def _contains(self, text: str, target: str) -> bool:
+        return any(True for _ in self._matches(text, target))
+
+    def _has_word(self, folded: str, target: str) -> bool:
+        for start, end in self._matches(folded, target):
+            before = folded[start - 1] if start > 0 else " "
+            after = folded[end] if end < len(folded) else " "
+            if not before.isalpha() and not after.isalpha():
+                return True
+        return False
+
+    def _has_spelled_out(self, folded: str, words: List[Tuple[int, int]], target: str) -> bool:
+        # Runs of single letters, e.g. "c a t" or "C-A-T"
+        run = []
+        for start, end in words + [(len(folded), len(folded))]:
+            if end - start == 1:
+                run.append(folded[start])
+                continue
+            if len(run) > 1 and self._contains("".join(run), target):
+                return True
+            run = []
+        return False
+
+    def _has_joined(self, letters: str, starts: set, ends: set, target: str) -> bool:
+        # Only matches that start and end on word boundaries; "concatenate" is not "cat"
+        return any(start in starts and end in ends for start, end in self._matches(letters, target))
+
+
+def fold(text: str) -> str:
+    return text.translate(FOLD).lower()
+
+
+def is_near_miss(word: str, target: str) -> bool:
+    """An anagram of target, or a word within a typo or two that isn't just target plus a suffix ("tigers")"""
+    if word == target or word.startswith(target):
+        return False
+    if len(word) == len(target) and sorted(word) == sorted(target):
+        return True
+    max_distance = 2 if len(target) >= 7 else 1 if len(target) >= 5 else 0
+    return max_distance > 0 and edit_distance(word, target, max_distance) <= max_distance
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, or limit + 1 once it is known to exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def looks_encoded(text: str) -> bool:
+    if any(char.isalpha() and not char.isascii() for char in text):
+        return True
+    for token in ENCODED_TOKENS.findall(text):
+        # Words are lowercase, capitalized or all caps; digits, symbols or mixed case inside are not
+        body = token[1:]
+        if any(char.isdigit() or char in "+/=" for char in token) or body not in (body.lower(), body.upper()):
+            return True
+    return False
+
+
+LEAK_MATCHER = LeakMatcher()
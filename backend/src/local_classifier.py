@@ -0,0 +1,122 @@
+import json
+import math
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+WORD = re.compile(r"[a-z0-9']+")
+
+# (below this the message is safe, above this it is unsafe); in between goes to the LLM guard
+DEFAULT_THRESHOLDS = {5: (0.1, 0.9), 6: (0.05, 0.95), 7: (0.05, 0.95)}
+
+
+def parse_thresholds(spec: str) -> Dict[int, Tuple[float, float]]:
+    """Parse "5:0.1:0.9,6:0.05:0.95" into per-level (safe, unsafe) thresholds"""
+    thresholds = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        level, safe_below, unsafe_above = part.split(":")
+        thresholds[int(level)] = (float(safe_below), float(unsafe_above))
+    return thresholds
+
+
+def extract_features(text: str) -> List[str]:
+    """Word unigrams and bigrams plus character trigrams inside words"""
+    words = WORD.findall(text.lower())
+    features = ["w:" + word for word in words]
+    features += ["b:" + first + " " + second for first, second in zip(words, words[1:])]
+    for word in words:
+        padded = "<" + word + ">"
+        features += ["c:" + padded[i:i + 3] for i in range(len(padded) - 2)]
+    return features
+
+
+class HashedNgramClassifier:
+    """Logistic regression over hashed n-gram features, scoring how likely a message is a password attack."""
+
+    def __init__(self, n_features: int = 2 ** 18, weights: Optional[Dict[int, float]] = None, bias: float = 0.0,
+                 thresholds: Optional[Dict[int, Tuple[float, float]]] = None):
+        self.n_features = n_features
+        self.weights = weights or {}
+        self.bias = bias
+        self.thresholds = dict(DEFAULT_THRESHOLDS if thresholds is None else thresholds)
+
+    def _indexes(self, text: str) -> List[int]:
+        # crc32 instead of hash() so indexes survive interpreter restarts
+        return [zlib.crc32(feature.encode()) % self.n_features for feature in extract_features(text)]
+
+    def score(self, text: str) -> float:
+        """Probability that the message is unsafe"""
+        indexes = self._indexes(text)
+        if not indexes:
+            return 0.5
+        z = self.bias + sum(self.weights.get(i, 0.0) for i in indexes) / math.sqrt(len(indexes))
+        return 1 / (1 + math.exp(-max(min(z, 30), -30)))
+
+    def classify(self, text: str, level: int) -> Optional[bool]:
+        """True if confidently safe, False if confidently unsafe, None to ask the LLM guard"""
+        thresholds = self.thresholds.get(level)
+        if thresholds is None:
+            return None
+        safe_below, unsafe_above = thresholds
+        score = self.score(text)
+        if score < safe_below:
+            return True
+        if score > unsafe_above:
+            return False
+        return None
+
+    def fit(self, examples: Iterable[Tuple[str, bool]], epochs: int = 10, learning_rate: float = 0.5, l2: float = 1e-5):
+        """Train with SGD on (message, is_safe) pairs, e.g. from a VerdictLog"""
+        examples = [(self._indexes(text), 0.0 if is_safe else 1.0) for text, is_safe in examples]
+        for _ in range(epochs):
+            for indexes, label in examples:
+                if not indexes:
+                    continue
+                scale = 1 / math.sqrt(len(indexes))
+                z = self.bias + sum(self.weights.get(i, 0.0) for i in indexes) * scale
+                error = 1 / (1 + math.exp(-max(min(z, 30), -30))) - label
+                self.bias -= learning_rate * error
+                for i in indexes:
+                    weight = self.weights.get(i, 0.0)
+                    self.weights[i] = weight - learning_rate * (error * scale + l2 * weight)
+        return self
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({
+                "n_features": self.n_features,
+                "bias": self.bias,
+                "weights": {str(i): w for i, w in self.weights.items() if w != 0.0},
+                "thresholds": {str(level): list(t) for level, t in self.thresholds.items()},
+            }, f)
+
+    @classmethod
+    def load(cls, path: str) -> "HashedNgramClassifier":
+        with open(path) as f:
+            data = json.load(f)
+        return cls(
+            n_features=data["n_features"],
+            weights={int(i): w for i, w in data["weights"].items()},
+            bias=data["bias"],
+            thresholds={int(level): tuple(t) for level, t in data["thresholds"].items()},
+        )
+
+
+class VerdictLog:
+    """Append-only JSON lines of LLM guard verdicts, the training data for the local classifier."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def record(self, text: str, level: int, is_safe: bool):
+        line = json.dumps({"text": text, "level": level, "safe": is_safe})
+        with self.lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+    def read(self) -> List[dict]:
+        with open(self.path) as f:
+            return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,199 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, description, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: bucket counts, then sum and count
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = self._format_labels(key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = self._format_labels(key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def counter(self, name: str, description: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, description, labelnames))
+
+    def gauge(self, name: str, description: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, description, labelnames))
+
+    def histogram(self, name: str, description: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+
+METRICS = MetricsRegistry()
+
+STAGE_LATENCY = METRICS.histogram(
+    "chat_stage_duration_seconds", "Latency of each chat pipeline stage", ["stage", "level"]
+)
+TIME_TO_FIRST_CHUNK = METRICS.histogram(
+    "chat_stream_first_chunk_seconds", "Time from request to the first chunk on /api/chat-stream", ["level"]
+)
+ROUTER_REQUESTS = METRICS.counter(
+    "llm_router_requests_total", "Calls the model router sent to each backend", ["backend", "outcome"]
+)
+ROUTER_HEDGES = METRICS.counter(
+    "llm_router_hedges_total", "Hedged calls started because the previous backend was slow", ["backend"]
+)
+LLM_TOKENS = METRICS.counter(
+    "llm_tokens_total", "Tokens reported by the provider", ["stage", "direction"]
+)
+GUARD_VERDICTS = METRICS.counter(
+    "guard_verdicts_total", "Input and output guard verdicts", ["guard", "level", "verdict"]
+)
+LOCAL_CLASSIFIER_VERDICTS = METRICS.counter(
+    "input_classifier_verdicts_total", "Local input classifier verdicts; uncertain ones go to the LLM guard", ["level", "verdict"]
+)
+LEAK_MATCHER_VERDICTS = METRICS.counter(
+    "output_leak_matcher_verdicts_total", "Local leak matcher verdicts; suspect ones go to the LLM guard", ["verdict"]
+)
+GUARD_BATCH_SIZE = METRICS.histogram(
+    "guard_batch_size", "Guard classifications sent per provider request", buckets=(1, 2, 4, 8, 16, 32)
+)
+PREFILTER_SHORT_CIRCUITS = METRICS.counter(
+    "prefilter_short_circuits_total", "Messages answered by a local pre-filter before any provider call", ["stage", "level"]
+)
+RULE_PREGENERATION = METRICS.counter(
+    "rule_pregeneration_total", "New-rule requests served from a rule started on the win, or generated on demand", ["result"]
+)
+RATE_LIMIT_REJECTIONS = METRICS.counter(
+    "rate_limit_rejections_total", "Requests rejected by the rate limiter", ["endpoint"]
+)
+ADMISSION_IN_FLIGHT = METRICS.gauge(
+    "admission_in_flight", "Requests holding a provider slot", ["provider"]
+)
+ADMISSION_QUEUE_DEPTH = METRICS.gauge(
+    "admission_queue_depth", "Requests waiting for a provider slot", ["provider"]
+)
+ADMISSION_WAIT = METRICS.histogram(
+    "admission_wait_seconds", "Time requests waited for a provider slot", ["provider", "priority"]
+)
+ADMISSION_REJECTIONS = METRICS.counter(
+    "admission_rejections_total", "Requests turned away because the provider queue was full", ["provider", "priority"]
+)
+SINGLE_FLIGHT_REQUESTS = METRICS.counter(
+    "single_flight_requests_total", "Chat requests that started a computation or joined an identical one in flight", ["kind", "role"]
+)
+RESPONSE_CACHE_LOOKUPS = METRICS.counter(
+    "response_cache_lookups_total", "Chat turns answered from the response cache, missed, or skipped for variety", ["result"]
+)
+# Copied from the model and guard caches when /metrics is scraped
+SPECULATIVE_GENERATIONS = METRICS.gauge(
+    "speculative_generations", "Speculative main generations started and wasted", ["outcome"]
+)
+GUARD_CACHE_LOOKUPS = METRICS.gauge(
+    "guard_cache_lookups", "Guard verdict cache hits and misses", ["guard", "result"]
+)
+
+
+def record_token_usage(stage: str, message) -> None:
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        LLM_TOKENS.inc(usage.get("input_tokens", 0), stage=stage, direction="input")
+        LLM_TOKENS.inc(usage.get("output_tokens", 0), stage=stage, direction="output")
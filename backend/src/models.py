@@ -1,21 +1,51 @@
-from typing import List, Generator
+import asyncio
+import time
+from typing import AsyncGenerator, Dict, List, Generator, Optional, Tuple
 
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
-from langchain_community.llms import Ollama
 
+from src.admission import AdmissionController
+from src.cache import TTLCache
+from src.capture import CaptureCallback, CaptureLog
+from src.fake_llm import FakeChatModel, ReplayChatModel
+from src.history import DEFAULT_HISTORY_BUDGETS, fit_history, fold_summary
 from src.input_guard import InputGuard
 from src.output_guard import OutputGuard
-from src.prompts import PROMPTS
+from src.metrics import GUARD_VERDICTS, RULE_PREGENERATION, STAGE_LATENCY, record_token_usage
+from src.prefilters import PrefilterPipeline
+from src.prompts import PROMPTS, RESPONSES
+from src.providers import awarm_up, limit_tokens, make_chat_model
+from src.registry import MAX_LEVEL, PipelineRegistry
+from src.response_cache import ResponseCache
+from src.router import RouterChatModel
 from src.schemas import Message
+from src.rule_store import InMemoryRuleStore, RuleStore
+from src.session_store import HISTORY_WINDOW, TOO_LONG_MARKER, HistoryWindow
+from src.speculation import SpeculativeStream, start_speculative
+
+# Output caps per role; guards only answer "safe" or "unsafe"
+ROLE_MAX_TOKENS = {"chat": 1024, "input_guard": 4, "output_guard": 4, "rule": 256}
+
+# Primary first; the others take over when it is slow or down
+DEFAULT_BACKENDS = [
+    ("groq", "meta-llama/llama-4-scout-17b-16e-instruct"),
+    ("groq", "llama-3.3-70b-versatile"),
+    ("ollama", "llama3.2:1b"),
+]
 
 
 
 class AbstractModel:
-    def __init__(self, model_name: str = None, thinking: bool = False):
+    def __init__(self, model_name: str = None, thinking: bool = False, speculative: bool = False, rule_store: RuleStore = None):
         self.llm = None
+        self.rule_llm = None
+        self.max_tokens = dict(ROLE_MAX_TOKENS)
+        self.history_budgets = dict(DEFAULT_HISTORY_BUDGETS)
         self.input_guard = None
         self.output_guard = None
+        self.registry = None
+        self.prefilters = None
         
         self.llm_rules = [
             "Speak in a similar maner that the user is speaking",
@@ -26,55 +56,251 @@ class AbstractModel:
             "I will improve the way the security expert checks the input",
             "I will outsource the output check to a security expert"
         ]
-        self.extra_llm_rules = []
+        self.rule_store = rule_store if rule_store is not None else InMemoryRuleStore()
         self.thinking = thinking
         self.thinking_message = "<think>I can't believe he said that...</think>" 
+
+        # Speculative mode starts the main generation alongside an LLM input guard
+        self.speculative = speculative
+        self.speculative_runs = 0
+        self.speculative_wasted = 0
+
+        # Next rule per session, started in the background as soon as the password is found
+        self.pending_rules = TTLCache(maxsize=10000, ttl=600)
+
+        # Opt-in, see ResponseCache
+        self.response_cache: Optional[ResponseCache] = None
     
 
-    def build_message(self, message: str, password: str, chat_history: List[str] = [], rules: List[str] = []) -> str:
+    def configure_roles(self, llm: BaseChatModel, role_llms: Optional[Dict[str, BaseChatModel]] = None, max_tokens: Optional[Dict[str, int]] = None):
+        """Set the chat model and, where given, separate models for the guards and rule generation, then compile"""
+        role_llms = role_llms or {}
+        self.max_tokens.update(max_tokens or {})
+        self.llm = llm
+        self.rule_llm = role_llms.get("rule", llm)
+        self.input_guard = InputGuard(role_llms.get("input_guard", llm), max_tokens=self.max_tokens["input_guard"])
+        self.output_guard = OutputGuard(role_llms.get("output_guard", llm), max_tokens=self.max_tokens["output_guard"])
+        self.compile()
+
+
+    def compile(self):
+        """Build the per-level chains and checkers once the LLM and guards are set"""
+        self.registry = PipelineRegistry(self)
+        self.prefilters = PrefilterPipeline(self)
+
+
+    def enable_capture(self, log: CaptureLog):
+        """Record every prompt and answer of the chat, guard and rule models to log"""
+        callback = CaptureCallback(log)
+        for llm in {id(llm): llm for llm in (self.llm, self.rule_llm, self.input_guard.llm, self.output_guard.llm)}.values():
+            llm.callbacks = list(llm.callbacks or []) + [callback]
+
+
+    async def awarm_up(self):
+        """Render every compiled prompt once and open provider connections, so the first player doesn't pay for it"""
+        history = self._format_chat_history([])
+        for pipeline in self.registry.levels:
+            pipeline.chat_chain.first.invoke(self._chat_inputs("hello", "PASSWORD", history, ""))
+        self.registry.new_rule_chain.first.invoke(self._new_rule_inputs(history, [], "PASSWORD"))
+
+        llms = {id(llm): llm for llm in (self.llm, self.rule_llm, self.input_guard.llm, self.output_guard.llm)}
+        results = await asyncio.gather(*(awarm_up(llm) for llm in llms.values()), return_exceptions=True)
+        for llm, result in zip(llms.values(), results):
+            if isinstance(result, Exception):
+                print(f"Warm-up of {llm._llm_type} failed: {result!r}")
+
+
+    def build_message(self, message: str, password: str, chat_history: List[str] = [], rules: List[str] = [], session_id: str = "") -> str:
         level = len(rules)
 
-        input_checker = self.input_guard.get_checker(level)
-        output_checker = self.output_guard.get_checker(level)
-        prompt_template = self._get_prompt_for_level(level)
+        pipeline = self.registry.get(level)
+        input_checker = pipeline.input_checker
+        output_checker = pipeline.output_checker
 
         formatted_chat_history = self._format_chat_history(chat_history)
 
-        if not input_checker(message, formatted_chat_history):
-            return "I see you're trying to steal my password. I won't answer you inside this chat. Start another conversation."
-        
-        if len(message) > 1024 or len(message.split(" ")) > 50:
-            return "I'm not going read all that. Can't you make it shorter?"
+        if not input_checker(message, self._history_for(formatted_chat_history, "input_guard")):
+            return RESPONSES["input_refusal"]
         
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", prompt_template),
-            ("human", "{input}"),
-        ])
-
-        chain = prompt | self.llm
+        chain = pipeline.chat_chain
 
         try:
-            response = chain.invoke({
-                "input": message, 
-                "password": password, 
-                    "chat_history": formatted_chat_history,
-                    "rules": "\n".join(self.extra_llm_rules)
-                })
+            with STAGE_LATENCY.time(stage="llm", level=pipeline.level):
+                response = chain.invoke(self._chat_inputs(message, password, formatted_chat_history, session_id))
+            record_token_usage("llm", response)
         except Exception as e:
-            return "The dev skimped on the LLM provider and I can't answer you... You should try again later."
+            return RESPONSES["provider_error"]
 
         response_text = response.content
 
         if not output_checker(response_text, password):
-            return "Almost had it! I'm not going to tell you that."
+            return RESPONSES["output_refusal"]
 
+        self._remember_response(message, password, formatted_chat_history, rules, session_id, response_text)
         return response_text
 
 
-    def stream_message(self, message: str, password: str, chat_history: List[str] = [], rules: List[str] = []) -> Generator[str]:
-        answer = self.build_message(message, password, chat_history, rules)
-        for word in answer.split(" "):
-            yield word + " "
+    async def abuild_message(self, message: str, password: str, chat_history: List[str] = [], rules: List[str] = [], session_id: str = "") -> str:
+        level = len(rules)
+
+        pipeline = self.registry.get(level)
+        input_checker = pipeline.async_input_checker
+        output_checker = pipeline.async_output_checker
+
+        formatted_chat_history = self._format_chat_history(chat_history)
+
+        chain = pipeline.chat_chain
+        prompt_rules = await self.rule_store.aget(session_id)
+        chat_inputs = self._chat_inputs(message, password, formatted_chat_history, session_id, prompt_rules)
+
+        llm_start = time.perf_counter()
+        generation = None
+        if self._should_speculate(level):
+            generation = start_speculative(chain.ainvoke(chat_inputs))
+            self.speculative_runs += 1
+
+        try:
+            is_safe = await input_checker(message, self._history_for(formatted_chat_history, "input_guard"))
+        except BaseException:
+            if generation is not None:
+                generation.cancel()
+            raise
+
+        if not is_safe:
+            if generation is not None:
+                generation.cancel()
+                self.speculative_wasted += 1
+            return RESPONSES["input_refusal"]
+        
+
+        try:
+            if generation is None:
+                llm_start = time.perf_counter()
+                generation = chain.ainvoke(chat_inputs)
+            response = await generation
+            STAGE_LATENCY.observe(time.perf_counter() - llm_start, stage="llm", level=pipeline.level)
+            record_token_usage("llm", response)
+        except Exception as e:
+            return RESPONSES["provider_error"]
+
+        response_text = response.content
+
+        if not await output_checker(response_text, password):
+            return RESPONSES["output_refusal"]
+
+        await self._aremember_response(message, password, formatted_chat_history, rules, session_id, response_text, prompt_rules)
+        return response_text
+
+
+    def stream_message(self, message: str, password: str, chat_history: List[str] = [], rules: List[str] = [], session_id: str = "") -> Generator[str, None, None]:
+        level = len(rules)
+
+        pipeline = self.registry.get(level)
+        input_checker = pipeline.input_checker
+        output_checker = pipeline.output_checker
+        stream_checker = self.output_guard.get_stream_checker(level, password)
+
+        formatted_chat_history = self._format_chat_history(chat_history)
+
+        if not input_checker(message, self._history_for(formatted_chat_history, "input_guard")):
+            yield RESPONSES["input_refusal"]
+            return
+        
+        chain = pipeline.chat_chain
+        prompt_rules = self.rule_store.get(session_id)
+
+        llm_start = time.perf_counter()
+        try:
+            for chunk in chain.stream(self._chat_inputs(message, password, formatted_chat_history, session_id, prompt_rules)):
+                record_token_usage("llm", chunk)
+                safe_text = stream_checker.feed(chunk.content)
+                if safe_text is None:
+                    self._record_stream_verdict(pipeline.level, stream_checker)
+                    yield RESPONSES["output_refusal"]
+                    return
+                if safe_text:
+                    yield safe_text
+        except Exception as e:
+            yield RESPONSES["provider_error"]
+            return
+        STAGE_LATENCY.observe(time.perf_counter() - llm_start, stage="llm", level=pipeline.level)
+
+        safe_text = stream_checker.flush()
+        self._record_stream_verdict(pipeline.level, stream_checker)
+        if safe_text is None or (stream_checker.hold_all and not output_checker(stream_checker.text, password)):
+            yield RESPONSES["output_refusal"]
+            return
+
+        if safe_text:
+            yield safe_text
+        self._remember_response(message, password, formatted_chat_history, rules, session_id, stream_checker.text, prompt_rules)
+
+
+    async def astream_message(self, message: str, password: str, chat_history: List[str] = [], rules: List[str] = [], session_id: str = "") -> AsyncGenerator[str, None]:
+        level = len(rules)
+
+        pipeline = self.registry.get(level)
+        input_checker = pipeline.async_input_checker
+        output_checker = pipeline.async_output_checker
+        stream_checker = self.output_guard.get_stream_checker(level, password)
+
+        formatted_chat_history = self._format_chat_history(chat_history)
+
+        chain = pipeline.chat_chain
+        prompt_rules = await self.rule_store.aget(session_id)
+        chat_inputs = self._chat_inputs(message, password, formatted_chat_history, session_id, prompt_rules)
+
+        llm_start = time.perf_counter()
+        speculative_stream = None
+        if self._should_speculate(level):
+            speculative_stream = SpeculativeStream(chain.astream(chat_inputs))
+            self.speculative_runs += 1
+
+        try:
+            is_safe = await input_checker(message, self._history_for(formatted_chat_history, "input_guard"))
+        except BaseException:
+            if speculative_stream is not None:
+                speculative_stream.cancel()
+            raise
+
+        if not is_safe:
+            if speculative_stream is not None:
+                speculative_stream.cancel()
+                self.speculative_wasted += 1
+            yield RESPONSES["input_refusal"]
+            return
+        
+
+        if speculative_stream is None:
+            llm_start = time.perf_counter()
+            chunks = chain.astream(chat_inputs)
+        else:
+            chunks = speculative_stream
+
+        try:
+            async for chunk in chunks:
+                record_token_usage("llm", chunk)
+                safe_text = stream_checker.feed(chunk.content)
+                if safe_text is None:
+                    self._record_stream_verdict(pipeline.level, stream_checker)
+                    yield RESPONSES["output_refusal"]
+                    return
+                if safe_text:
+                    yield safe_text
+        except Exception as e:
+            yield RESPONSES["provider_error"]
+            return
+        STAGE_LATENCY.observe(time.perf_counter() - llm_start, stage="llm", level=pipeline.level)
+
+        safe_text = stream_checker.flush()
+        self._record_stream_verdict(pipeline.level, stream_checker)
+        if safe_text is None or (stream_checker.hold_all and not await output_checker(stream_checker.text, password)):
+            yield RESPONSES["output_refusal"]
+            return
+
+        if safe_text:
+            yield safe_text
+        await self._aremember_response(message, password, formatted_chat_history, rules, session_id, stream_checker.text, prompt_rules)
 
 
     def build_congratulations(self) -> str:
@@ -83,51 +309,223 @@ class AbstractModel:
 
 
     def stream_congratulations(self) -> Generator[str, None, None]:
-        text = self.build_congratulations()
+        yield from self.stream_text(self.build_congratulations())
+
+
+    def stream_text(self, text: str) -> Generator[str, None, None]:
         for word in text.split(" "):
             yield word + " "
 
 
-    def get_new_rule(self, chat_history: List[str], rules: List[str], password: str):
+    def lookup_response(self, message: str, password: str, chat_history: List[Message], rules: List[str], session_id: str = "") -> Optional[str]:
+        """Cached answer to this exact turn, if the response cache is on and has one"""
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get(self._response_key(message, password, self._format_chat_history(chat_history), rules, session_id))
+
+
+    async def alookup_response(self, message: str, password: str, chat_history: List[Message], rules: List[str], session_id: str = "") -> Optional[str]:
+        if self.response_cache is None:
+            return None
+        prompt_rules = await self.rule_store.aget(session_id)
+        return self.response_cache.get(self._response_key(message, password, self._format_chat_history(chat_history), rules, session_id, prompt_rules))
+
+
+    def get_new_rule(self, chat_history: List[str], rules: List[str], password: str, session_id: str = ""):
         if len(rules) < len(self.llm_rules):
             return self.llm_rules[len(rules)]
         else:
-            return self._generate_new_rule(chat_history, rules, password)
+            return self._generate_new_rule(chat_history, rules, password, session_id)
 
 
-    def reset_game(self):
-        self.extra_llm_rules = []
+    async def aget_new_rule(self, chat_history: List[str], rules: List[str], password: str, session_id: str = "",
+                            admission: Optional[AdmissionController] = None):
+        """Claims a pregenerated rule, which holds its own provider slot, or generates one in a "new-rule" slot"""
+        if len(rules) < len(self.llm_rules):
+            return self.llm_rules[len(rules)]
+
+        pending = self.pending_rules.pop(session_id)
+        if pending is not None and pending[0] == len(rules):
+            try:
+                response_text = await pending[1]
+                RULE_PREGENERATION.inc(result="hit")
+                return await self._astore_new_rule(response_text, session_id)
+            except Exception:
+                pass
+        RULE_PREGENERATION.inc(result="miss")
+        if admission is None:
+            return await self._agenerate_new_rule(chat_history, rules, password, session_id)
+        async with admission.slot("new-rule"):
+            return await self._agenerate_new_rule(chat_history, rules, password, session_id)
+
+
+    def pregenerate_rule(self, chat_history: List[str], rules: List[str], password: str, session_id: str = "",
+                         admission: Optional[AdmissionController] = None):
+        """Start generating the rule for the next level, picked up later by aget_new_rule"""
+        if len(rules) < len(self.llm_rules):
+            return
+        task = asyncio.get_running_loop().create_task(self._apregenerate_rule(chat_history, rules, password, admission))
+        # Failures are retried synchronously on claim, don't let them warn when never claimed
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self.pending_rules.set(session_id, (len(rules), task))
+
+
+    def reset_game(self, session_id: str = None):
+        self.rule_store.clear(session_id)
+        self._forget_pending_rules(session_id)
+
+
+    async def areset_game(self, session_id: str = None):
+        await self.rule_store.aclear(session_id)
+        self._forget_pending_rules(session_id)
+
+
+    def _forget_pending_rules(self, session_id: Optional[str]):
+        if session_id is None:
+            self.pending_rules.clear()
+        else:
+            self.pending_rules.pop(session_id)
+
+
+    def _record_stream_verdict(self, level: int, stream_checker):
+        if stream_checker.pattern is not None:
+            GUARD_VERDICTS.inc(guard="output_stream", level=level, verdict="unsafe" if stream_checker.leaked else "safe")
+
+
+    def _should_speculate(self, level: int) -> bool:
+        # Only worth it when the input guard is itself a provider round-trip
+        return self.speculative and self.input_guard.uses_llm(level)
 
 
     def _get_prompt_for_level(self, level: int) -> str:
         return PROMPTS["chat_prompt"] if level == 1 else PROMPTS["chat_prompt_v2"]
 
 
-    def _generate_new_rule(self, chat_history: List[str], rules: List[str], password: str):
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", PROMPTS["new_rule"])
-        ])
-
-        chain = prompt | self.llm
+    def _generate_new_rule(self, chat_history: List[str], rules: List[str], password: str, session_id: str = ""):
+        chain = self.registry.new_rule_chain
         try:
-            response = chain.invoke({
-                "chat_history": self._format_chat_history(chat_history), 
-                "password": password, "rules": "\n".join(self.llm_rules + rules)
-            })
+            with STAGE_LATENCY.time(stage="rule_generation", level=min(len(rules), MAX_LEVEL)):
+                response = chain.invoke(self._new_rule_inputs(chat_history, rules, password))
+            record_token_usage("rule_generation", response)
             response_text = response.content
         except Exception as e:
             # Return default message if chain invoke fails (e.g., 500 error)
-            response_text = "The dev skimped on the LLM provider and I can't create new rules... You should try again later."
+            response_text = RESPONSES["rule_error"]
+
+        return self._store_new_rule(response_text, session_id)
+
+
+    async def _agenerate_new_rule(self, chat_history: List[str], rules: List[str], password: str, session_id: str = ""):
+        try:
+            response_text = await self._arule_text(chat_history, rules, password)
+        except Exception as e:
+            # Return default message if chain invoke fails (e.g., 500 error)
+            response_text = RESPONSES["rule_error"]
+
+        return await self._astore_new_rule(response_text, session_id)
+
+
+    async def _apregenerate_rule(self, chat_history: List[str], rules: List[str], password: str,
+                                 admission: Optional[AdmissionController]) -> str:
+        if admission is None:
+            return await self._arule_text(chat_history, rules, password)
+        # Queued like a /api/new-rule request, behind the chats
+        async with admission.slot("new-rule"):
+            return await self._arule_text(chat_history, rules, password)
+
+
+    async def _arule_text(self, chat_history: List[str], rules: List[str], password: str) -> str:
+        chain = self.registry.new_rule_chain
+        with STAGE_LATENCY.time(stage="rule_generation", level=min(len(rules), MAX_LEVEL)):
+            response = await chain.ainvoke(self._new_rule_inputs(chat_history, rules, password))
+        record_token_usage("rule_generation", response)
+        return response.content
+
+
+    def _store_new_rule(self, response_text: str, session_id: str) -> str:
+        response_text = self._clean_rule(response_text)
+        self.rule_store.append(session_id, response_text)
+        return response_text
+
+
+    async def _astore_new_rule(self, response_text: str, session_id: str) -> str:
+        response_text = self._clean_rule(response_text)
+        await self.rule_store.aappend(session_id, response_text)
+        return response_text
+
 
+    def _clean_rule(self, response_text: str) -> str:
         if self.thinking:
             response_text = response_text.split("</think>")[-1].strip()
-
-        self.extra_llm_rules.append(response_text)
         return response_text
+
+
+    def _build_chat_chain(self, level: int):
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", self._get_prompt_for_level(level)),
+            ("human", "{input}"),
+        ])
+        return prompt | limit_tokens(self.llm, self.max_tokens["chat"])
+
+
+    def _chat_inputs(self, message: str, password: str, formatted_chat_history: List[dict], session_id: str,
+                     prompt_rules: Optional[List[str]] = None) -> dict:
+        # Async callers pass the session's rules, read off the event loop
+        if prompt_rules is None:
+            prompt_rules = self.rule_store.get(session_id)
+        return {
+            "input": message, 
+            "password": password, 
+            "chat_history": self._history_for(formatted_chat_history, "chat"),
+            "rules": "\n".join(prompt_rules)
+        }
+
+
+    def _build_new_rule_chain(self):
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", PROMPTS["new_rule"])
+        ])
+        return prompt | limit_tokens(self.rule_llm, self.max_tokens["rule"])
+
+
+    def _new_rule_inputs(self, chat_history: List[str], rules: List[str], password: str) -> dict:
+        return {
+            "chat_history": self._history_for(self._format_chat_history(chat_history), "rule"),
+            "password": password, "rules": "\n".join(self.llm_rules + rules)
+        }
     
 
-    def _format_chat_history(self, chat_history: List[Message]) -> str:
-        # Filter out pairs where AI said "I'm not going read all that. Can't you make it shorter?"
+    def _response_key(self, message: str, password: str, formatted_chat_history: List[dict], rules: List[str], session_id: str,
+                      prompt_rules: Optional[List[str]] = None) -> str:
+        # Exactly what the chat prompt sees
+        if prompt_rules is None:
+            prompt_rules = self.rule_store.get(session_id)
+        return self.response_cache.key(len(rules), password, prompt_rules, self._history_for(formatted_chat_history, "chat"), message)
+
+
+    def _remember_response(self, message: str, password: str, formatted_chat_history: List[dict], rules: List[str], session_id: str, text: str,
+                           prompt_rules: Optional[List[str]] = None):
+        # Only answers that got past both guards
+        if self.response_cache is not None and text:
+            self.response_cache.add(self._response_key(message, password, formatted_chat_history, rules, session_id, prompt_rules), text)
+
+
+    async def _aremember_response(self, message: str, password: str, formatted_chat_history: List[dict], rules: List[str], session_id: str, text: str,
+                                  prompt_rules: List[str]):
+        if self.response_cache is not None and text:
+            await self.response_cache.aadd(self._response_key(message, password, formatted_chat_history, rules, session_id, prompt_rules), text)
+
+
+    def _history_for(self, history: List[dict], role: str) -> List[dict]:
+        # Trimmed to the role's token budget, older messages go to the summary
+        return fit_history(list(history), getattr(history, "summary", ""), self.history_budgets[role])
+
+
+    def _format_chat_history(self, chat_history: List[Message]) -> HistoryWindow:
+        if isinstance(chat_history, HistoryWindow):
+            return HistoryWindow(chat_history)
+
+        # Filter out pairs where AI refused because the message was too long
         filtered_messages = []
         
         # Process messages in reverse pairs (user, assistant)
@@ -137,7 +535,7 @@ class AbstractModel:
                 assistant_msg = chat_history[i + 1]
                 
                 # Skip this pair if the assistant said the specific message
-                if "I'm not going read all that" in assistant_msg.text:
+                if TOO_LONG_MARKER in assistant_msg.text:
                     continue
                 
                 filtered_messages.extend([user_msg, assistant_msg])
@@ -145,31 +543,56 @@ class AbstractModel:
                 # Handle odd number of messages (dangling user message)
                 filtered_messages.append(chat_history[i])
         
-        # Keep only the last 5 messages to save on tokens
-        recent_messages = filtered_messages[-5:]
-        
         processed_messages = [
             {"role": "user" if msg.isUser else "assistant", "content": msg.text}
-            for msg in recent_messages
+            for msg in filtered_messages
         ]
-        print(processed_messages)
-
-        return processed_messages
+        # Keep only the last 5 messages to save on tokens, older ones are summarized
+        return HistoryWindow(processed_messages[-HISTORY_WINDOW:], fold_summary("", processed_messages[:-HISTORY_WINDOW]))
     
 
 class OllamaModel(AbstractModel):
-    def __init__(self, model_name: str = "llama3.2:1b", thinking: bool = False):
-        super().__init__()
-        self.llm = Ollama(model=model_name)
-        self.input_guard = InputGuard(self.llm)
-        self.output_guard = OutputGuard(self.llm)
+    def __init__(self, model_name: str = "llama3.2:1b", thinking: bool = False, speculative: bool = False, rule_store: RuleStore = None,
+                 role_llms: Optional[Dict[str, BaseChatModel]] = None, max_tokens: Optional[Dict[str, int]] = None):
+        super().__init__(speculative=speculative, rule_store=rule_store)
+        self.configure_roles(make_chat_model("ollama", model_name), role_llms, max_tokens)
 
 
 class GroqModel(AbstractModel):
-    def __init__(self, model_name: str = "llama-3.3-70b-versatile", thinking: bool = False):
-        super().__init__()
-        self.llm = ChatGroq(model_name=model_name)
-        self.input_guard = InputGuard(self.llm)
-        self.output_guard = OutputGuard(self.llm)
-    
-    
\ No newline at end of file
+    def __init__(self, model_name: str = "llama-3.3-70b-versatile", thinking: bool = False, speculative: bool = False, rule_store: RuleStore = None,
+                 role_llms: Optional[Dict[str, BaseChatModel]] = None, max_tokens: Optional[Dict[str, int]] = None):
+        super().__init__(speculative=speculative, rule_store=rule_store)
+        self.configure_roles(make_chat_model("groq", model_name), role_llms, max_tokens)
+
+
+class RouterModel(AbstractModel):
+    """Groq and Ollama backends behind one router, with hedging and failover between them."""
+
+    def __init__(self, backends: List[Tuple[str, str]] = DEFAULT_BACKENDS, hedge_percentile: float = 0.95, thinking: bool = False, speculative: bool = False, rule_store: RuleStore = None,
+                 role_llms: Optional[Dict[str, BaseChatModel]] = None, max_tokens: Optional[Dict[str, int]] = None):
+        super().__init__(speculative=speculative, rule_store=rule_store)
+        llm = RouterChatModel(
+            # Failing over is faster than the provider client's own retries
+            backends=[make_chat_model(provider, model_name, max_retries=0) for provider, model_name in backends],
+            backend_names=[f"{provider}:{model_name}" for provider, model_name in backends],
+            hedge_percentile=hedge_percentile,
+        )
+        self.configure_roles(llm, role_llms, max_tokens)
+
+
+class FakeModel(AbstractModel):
+    """Provider-free model for load tests, with guards that always answer "safe"."""
+
+    def __init__(self, latency: float = 0.2, tokens_per_second: float = 200.0, failure_rate: float = 0.0, guard_latency: float = 0.1, speculative: bool = False, rule_store: RuleStore = None):
+        super().__init__(speculative=speculative, rule_store=rule_store)
+        llm = FakeChatModel(latency=latency, tokens_per_second=tokens_per_second, failure_rate=failure_rate)
+        guard_llm = FakeChatModel(reply="safe", latency=guard_latency, tokens_per_second=0, failure_rate=failure_rate)
+        self.configure_roles(llm, {"input_guard": guard_llm, "output_guard": guard_llm})
+
+
+class ReplayModel(AbstractModel):
+    """Answers every role with the LLM calls of a capture, for offline replay."""
+
+    def __init__(self, calls: Dict[str, List[dict]], latency_scale: float = 1.0, rule_store: RuleStore = None):
+        super().__init__(rule_store=rule_store)
+        self.configure_roles(ReplayChatModel(calls=calls, latency_scale=latency_scale))
@@ -1,18 +1,25 @@
-import re
 from functools import partial
-from typing import Callable
+from typing import Awaitable, Callable, Optional
 
-from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.language_models import BaseChatModel
 
+from src.cache import TTLCache, hash_key
+from src.guard import LLMGuard
+from src.leak_matcher import CLEAN, LEAK, LEAK_MATCHER, LeakMatcher
+from src.metrics import LEAK_MATCHER_VERDICTS
+from src.passwords import password_pattern
 from src.prompts import PROMPTS
 
 
-class OutputGuard:
-    def __init__(self, llm: BaseChatModel):
-        self.llm = llm
+class OutputGuard(LLMGuard):
+    def __init__(self, llm: BaseChatModel, cache: Optional[TTLCache] = None, leak_matcher: LeakMatcher = LEAK_MATCHER,
+                 max_tokens: Optional[int] = None):
+        # Canned refusals and repeated answers come back often, the cache reuses their verdicts
+        super().__init__(llm, cache, max_tokens, (PROMPTS["output_guard"],))
+        # Settles most answers locally; only obfuscation it is unsure about goes to the LLM
+        self.leak_matcher = leak_matcher
 
-    def get_checker(self, level: int) -> Callable[[str], bool]:
+    def get_checker(self, level: int) -> Callable[[str, str], bool]:
         if level < 3:
             return self.skip_check
         elif level < 7:
@@ -22,25 +29,160 @@ class OutputGuard:
             prompt_template = PROMPTS["output_guard"]
             return partial(self.llm_check, prompt_template=prompt_template)
 
+    def get_async_checker(self, level: int) -> Callable[[str, str], Awaitable[bool]]:
+        if level < 3:
+            return self.askip_check
+        elif level < 7:
+            return self.aregex_check
+        else:
+            prompt_template = PROMPTS["output_guard"]
+            return partial(self.allm_check, prompt_template=prompt_template)
+
+    def get_stream_checker(self, level: int, password: str) -> "StreamingLeakCheck":
+        if level < 3:
+            return StreamingLeakCheck()
+        elif level < 7:
+            return StreamingLeakCheck(password)
+        else:
+            # The LLM verdict needs the full answer, so nothing is released before it
+            return StreamingLeakCheck(password, hold_all=True, leak_matcher=self.leak_matcher)
+
     def skip_check(self, model_output: str, password: str) -> bool:
         return True
     
     def regex_check(self, model_output: str, password: str) -> bool:
-        pattern = r'\b(' + password + r')\b'
-        return not bool(re.search(pattern, model_output))
+        return not bool(password_pattern(password).search(model_output))
 
     def llm_check(self, model_output: str, password: str, prompt_template: str) -> bool:
         if not self.regex_check(model_output, password):
             return False
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", prompt_template)
-        ])
+        is_safe = self._match_verdict(model_output, password)
+        if is_safe is not None:
+            return is_safe
+
+        cache_key = hash_key(prompt_template, model_output, password)
+        is_safe = self.cache.get(cache_key)
+        if is_safe is not None:
+            return is_safe
 
-        chain = prompt | self.llm
+        chain = self._get_chain(prompt_template)
         response = chain.invoke({
             "model_output": model_output,
             "password": password
         })
 
-        return response.content == "safe"
\ No newline at end of file
+        is_safe = response.content == "safe"
+        self.cache.set(cache_key, is_safe)
+        return is_safe
+
+    async def askip_check(self, model_output: str, password: str) -> bool:
+        return self.skip_check(model_output, password)
+
+    async def aregex_check(self, model_output: str, password: str) -> bool:
+        return self.regex_check(model_output, password)
+
+    async def allm_check(self, model_output: str, password: str, prompt_template: str) -> bool:
+        if not self.regex_check(model_output, password):
+            return False
+
+        is_safe = self._match_verdict(model_output, password)
+        if is_safe is not None:
+            return is_safe
+
+        cache_key = hash_key(prompt_template, model_output, password)
+        is_safe = self.cache.get(cache_key)
+        if is_safe is not None:
+            return is_safe
+
+        inputs = {
+            "model_output": model_output,
+            "password": password
+        }
+        if self.batch_window > 0:
+            is_safe = await self._get_batcher(prompt_template).submit(inputs)
+        else:
+            is_safe = await self._aclassify(prompt_template, inputs)
+
+        self.cache.set(cache_key, is_safe)
+        return is_safe
+
+    def _match_verdict(self, model_output: str, password: str) -> Optional[bool]:
+        verdict = self.leak_matcher.scan(model_output, password)
+        LEAK_MATCHER_VERDICTS.inc(verdict=verdict)
+        if verdict == LEAK:
+            return False
+        if verdict == CLEAN:
+            return True
+        return None
+
+
+class StreamingLeakCheck:
+    """Incremental version of OutputGuard.regex_check for streamed answers.
+
+    Chunks go in through feed(), which returns the text that can safely be
+    released, or None as soon as the password shows up. The last len(password)
+    characters are held back, so a password split across chunk boundaries is
+    never released before it can be matched.
+
+    With a leak matcher (hold_all levels), obfuscated leaks such as spelled-out
+    letters or leetspeak also stop the stream as soon as they are complete.
+    """
+
+    def __init__(self, password: Optional[str] = None, hold_all: bool = False, leak_matcher: Optional[LeakMatcher] = None):
+        self.password = password
+        self.pattern = password_pattern(password) if password else None
+        self.hold = len(password) if password else 0
+        self.hold_all = hold_all
+        self.leak_matcher = leak_matcher if password else None
+        self.text = ""
+        self.released = 0
+        self.leaked = False
+
+    def feed(self, chunk: str) -> Optional[str]:
+        if self.leaked:
+            return None
+
+        search_from = max(0, len(self.text) - self.hold)
+        self.text += chunk
+
+        if self.pattern is not None:
+            match = self.pattern.search(self.text, search_from)
+            # A match touching the end of the text may still grow into a longer word
+            if match and match.end() < len(self.text):
+                self.leaked = True
+                return None
+
+        if self.leak_matcher is not None and self._matcher_leak(search_from):
+            self.leaked = True
+            return None
+
+        if self.hold_all:
+            return ""
+        return self._release(len(self.text) - self.hold)
+
+    def flush(self) -> Optional[str]:
+        if self.leaked:
+            return None
+
+        if self.pattern is not None and self.pattern.search(self.text, max(0, self.released - 1)):
+            self.leaked = True
+            return None
+
+        return self._release(len(self.text))
+
+    def _matcher_leak(self, search_from: int) -> bool:
+        # Rescan a bounded window of whole words, leaving out the word still being written
+        end = max(self.text.rfind(" "), self.text.rfind("\n"))
+        start = max(0, search_from - 4 * self.hold)
+        start = max(self.text.rfind(" ", 0, start), self.text.rfind("\n", 0, start)) + 1
+        if end <= start:
+            return False
+        return self.leak_matcher.has_leak(self.text[start:end], self.password)
+
+    def _release(self, upto: int) -> str:
+        if upto <= self.released:
+            return ""
+        released_text = self.text[self.released:upto]
+        self.released = upto
+        return released_text
@@ -0,0 +1,20 @@
+import re
+
+PASSWORD_CHOICES = (
+    "password", "cat", "mouse", "dog", "bird", "fish", "horse", "rabbit", 
+    "snake", "tiger", "lion", "elephant", "giraffe", "zebra", "penguin", 
+    "koala", "kangaroo", "panda", "bear", "fox", "wolf", "cat", "dog", 
+    "bird", "fish", "horse", "rabbit", "snake", "tiger", "lion", "elephant", 
+    "giraffe", "zebra", "penguin", "koala", "panda", "bear", "fox", "wolf"
+)
+
+PASSWORDS = tuple(password.upper() for password in PASSWORD_CHOICES)
+
+PASSWORD_PATTERNS = {password: re.compile(r'\b(' + password + r')\b') for password in PASSWORDS}
+
+
+def password_pattern(password: str) -> re.Pattern:
+    pattern = PASSWORD_PATTERNS.get(password)
+    if pattern is None:
+        pattern = re.compile(r'\b(' + password + r')\b')
+    return pattern
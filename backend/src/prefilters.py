@@ -0,0 +1,78 @@
+import re
+from typing import TYPE_CHECKING, List, Optional
+
+from src.metrics import PREFILTER_SHORT_CIRCUITS
+from src.prompts import RESPONSES
+from src.registry import MAX_LEVEL
+
+if TYPE_CHECKING:
+    from src.models import AbstractModel
+
+CAPITALIZED_WORD = re.compile(r'\b[A-Z]+\b')
+MAX_MESSAGE_CHARS = 1024
+MAX_MESSAGE_WORDS = 50
+
+
+class PrefilterResult:
+    def __init__(self, stage: str, response: str, is_done: bool = False):
+        self.stage = stage
+        self.response = response
+        self.is_done = is_done
+
+
+def extract_first_capitalized_word(message: str) -> Optional[str]:
+    match = CAPITALIZED_WORD.search(message)
+    if match:
+        return match.group(0)
+    return None
+
+
+def is_too_long(message: str) -> bool:
+    return len(message) > MAX_MESSAGE_CHARS or len(message.split(" ")) > MAX_MESSAGE_WORDS
+
+
+class PrefilterPipeline:
+    """Local checks that answer a message without any provider call, cheapest first."""
+
+    def __init__(self, model: "AbstractModel"):
+        self.model = model
+        self.stages = [
+            ("password_match", self.password_match),
+            ("length", self.length_limit),
+            ("password_mention", self.password_mention),
+            ("canned_refusal", self.canned_refusal),
+        ]
+
+    def run(self, message: str, password: str, chat_history: List[dict], level: int) -> Optional[PrefilterResult]:
+        for stage, check in self.stages:
+            result = check(message, password, chat_history, level)
+            if result is not None:
+                PREFILTER_SHORT_CIRCUITS.inc(stage=stage, level=min(level, MAX_LEVEL))
+                return PrefilterResult(stage, result, is_done=stage == "password_match")
+        return None
+
+    def password_match(self, message: str, password: str, chat_history: List[dict], level: int) -> Optional[str]:
+        if extract_first_capitalized_word(message) == password:
+            return self.model.build_congratulations()
+        return None
+
+    def length_limit(self, message: str, password: str, chat_history: List[dict], level: int) -> Optional[str]:
+        if is_too_long(message):
+            return RESPONSES["too_long"]
+        return None
+
+    def password_mention(self, message: str, password: str, chat_history: List[dict], level: int) -> Optional[str]:
+        # The same regex the input guard runs before its LLM check from level 4 on
+        if level >= 4 and not self.model.input_guard.regex_check(message, chat_history):
+            return RESPONSES["input_refusal"]
+        return None
+
+    def canned_refusal(self, message: str, password: str, chat_history: List[dict], level: int) -> Optional[str]:
+        # The refusal tells the player this chat is over; the LLM guard would only agree
+        if not self.model.input_guard.uses_llm(level):
+            return None
+        for entry in chat_history:
+            if entry["role"] == "assistant" and entry["content"] == RESPONSES["input_refusal"]:
+                return RESPONSES["input_refusal"]
+        return None
+
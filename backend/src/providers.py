@@ -0,0 +1,105 @@
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+
+# Provider packages are imported on first use, each one pulls in a large import graph
+
+# One keep-alive pool per process, shared by every Groq model
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+REQUEST_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+# Name of the output cap argument by model type; the router translates it for each backend
+MAX_TOKENS_ARGS = {"groq-chat": "max_tokens", "ollama-chat": "num_predict", "router": "max_tokens"}
+
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+
+
+def http_client() -> httpx.Client:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(limits=POOL_LIMITS, timeout=REQUEST_TIMEOUT)
+    return _http_client
+
+
+def http_async_client() -> httpx.AsyncClient:
+    global _http_async_client
+    if _http_async_client is None:
+        _http_async_client = httpx.AsyncClient(limits=POOL_LIMITS, timeout=REQUEST_TIMEOUT)
+    return _http_async_client
+
+
+def parse_backends(spec: str) -> List[Tuple[str, str]]:
+    """Parse "groq:llama-3.3-70b-versatile,ollama:llama3.2:1b" into (provider, model) pairs"""
+    backends = []
+    for part in spec.split(","):
+        if part.strip():
+            provider, model_name = part.strip().split(":", 1)
+            backends.append((provider, model_name))
+    return backends
+
+
+def parse_role_settings(spec: str) -> Dict[str, str]:
+    """Parse "input_guard=ollama:llama3.2:1b,rule=..." or "chat=1024,input_guard=4" into a dict per role"""
+    settings = {}
+    for part in spec.split(","):
+        if part.strip():
+            role, value = part.strip().split("=", 1)
+            settings[role] = value
+    return settings
+
+
+def max_tokens_kwargs(llm: BaseChatModel, max_tokens: Optional[int]) -> dict:
+    """Call arguments that cap the output of llm at max_tokens"""
+    name = MAX_TOKENS_ARGS.get(llm._llm_type)
+    if max_tokens is None or name is None:
+        return {}
+    return {name: max_tokens}
+
+
+def limit_tokens(llm: BaseChatModel, max_tokens: Optional[int]):
+    kwargs = max_tokens_kwargs(llm, max_tokens)
+    return llm.bind(**kwargs) if kwargs else llm
+
+
+def make_chat_model(provider: str, model_name: str, max_retries: int = 2) -> BaseChatModel:
+    if provider == "groq":
+        from langchain_groq import ChatGroq
+        return ChatGroq(
+            model_name=model_name,
+            http_client=http_client(),
+            http_async_client=http_async_client(),
+            max_retries=max_retries,
+        )
+    elif provider == "ollama":
+        from langchain_community.chat_models import ChatOllama
+        # Keeping the model loaded between turns keeps its prompt cache warm
+        return ChatOllama(
+            model=model_name,
+            base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+            keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+        )
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+def make_role_models(spec: str) -> Dict[str, BaseChatModel]:
+    """Models for "input_guard=ollama:llama3.2:1b,output_guard=ollama:llama3.2:1b" style settings"""
+    return {
+        role: make_chat_model(*backend.split(":", 1))
+        for role, backend in parse_role_settings(spec).items()
+    }
+
+
+async def awarm_up(llm: BaseChatModel):
+    """Open a pooled connection to the provider of llm, or load the model into Ollama"""
+    if llm._llm_type == "router":
+        await asyncio.gather(*(awarm_up(backend) for backend in llm.backends))
+    elif llm._llm_type == "groq-chat":
+        # Any answer will do, the point is the TLS handshake
+        await http_async_client().head(llm.groq_api_base or "https://api.groq.com")
+    elif llm._llm_type == "ollama-chat":
+        # A generate request without a prompt only loads the model
+        await http_async_client().post(f"{llm.base_url}/api/generate", json={"model": llm.model, "keep_alive": llm.keep_alive})
@@ -0,0 +1,163 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from src.metrics import RATE_LIMIT_REJECTIONS
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+# Buckets that refilled to capacity are dropped every this many takes
+PRUNE_EVERY = 1000
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, limit: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded: {limit}")
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+def parse_rate(rate: str) -> tuple[int, float]:
+    """Turn "42/minute" into a bucket capacity and a refill rate in tokens per second."""
+    count, period = rate.split("/")
+    return int(count), int(count) / PERIODS[period.strip()]
+
+
+def refill(tokens: float, updated_at: float, now: float, capacity: int, refill_rate: float) -> float:
+    return min(capacity, tokens + (now - updated_at) * refill_rate)
+
+
+class BucketBackend:
+    """Counts takes and knows the longest time any registered bucket needs to refill.
+
+    A bucket untouched for that long is full again, the same as no bucket,
+    so it can be dropped.
+    """
+
+    # Blocking backends are called from a worker thread
+    blocking = False
+
+    def __init__(self):
+        self.refill_time = 0.0
+        self._takes = 0
+
+    def register(self, capacity: int, refill_rate: float):
+        self.refill_time = max(self.refill_time, capacity / refill_rate)
+
+    def _should_prune(self) -> bool:
+        self._takes += 1
+        # Without registered limits any bucket might still be refilling
+        return self.refill_time > 0 and self._takes % PRUNE_EVERY == 0
+
+
+class InMemoryBucketBackend(BucketBackend):
+    """Token buckets for a single process."""
+
+    def __init__(self):
+        super().__init__()
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, refill_rate: float) -> float:
+        """Take one token, returns 0 on success or the seconds until one is available."""
+        now = time.time()
+        with self._lock:
+            if self._should_prune():
+                self.prune(now)
+            tokens, updated_at = self.buckets.get(key, (capacity, now))
+            tokens = refill(tokens, updated_at, now, capacity, refill_rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now)
+                return (1 - tokens) / refill_rate
+            self.buckets[key] = (tokens - 1, now)
+            return 0
+
+    def prune(self, now: float):
+        full_before = now - self.refill_time
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[1] > full_before}
+
+
+class SQLiteBucketBackend(BucketBackend):
+    """Token buckets in a SQLite file shared by every worker process."""
+
+    blocking = True
+
+    def __init__(self, path: str = "rate_limits.db"):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS buckets_age ON buckets (updated_at)")
+
+    def take(self, key: str, capacity: int, refill_rate: float) -> float:
+        with self._lock:
+            if self._should_prune():
+                self.prune(time.time())
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = refill(row[0], row[1], now, capacity, refill_rate) if row else capacity
+                retry_after = 0 if tokens >= 1 else (1 - tokens) / refill_rate
+                if tokens >= 1:
+                    tokens -= 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)", (key, tokens, now)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return retry_after
+
+    def prune(self, now: float):
+        self._conn.execute("DELETE FROM buckets WHERE updated_at <= ?", (now - self.refill_time,))
+
+
+class RateLimiter:
+    """Per-endpoint, per-client token bucket limits, used as a FastAPI dependency."""
+
+    def __init__(self, key_func: Callable[[Request], str], backend=None):
+        self.key_func = key_func
+        self.backend = backend if backend is not None else InMemoryBucketBackend()
+
+    def limit(self, rate: str, scope: Optional[str] = None):
+        capacity, refill_rate = parse_rate(rate)
+        limit = rate.replace("/", " per 1 ")
+        self.backend.register(capacity, refill_rate)
+
+        async def check_rate_limit(request: Request):
+            endpoint = scope or request.url.path
+            key = f"{endpoint}:{self.key_func(request)}"
+            if self.backend.blocking:
+                # SQLite may wait up to its busy timeout for other workers
+                retry_after = await asyncio.to_thread(self.backend.take, key, capacity, refill_rate)
+            else:
+                retry_after = self.backend.take(key, capacity, refill_rate)
+            if retry_after:
+                RATE_LIMIT_REJECTIONS.inc(endpoint=endpoint)
+                raise RateLimitExceeded(limit, retry_after)
+
+        return check_rate_limit
+
+
+def create_rate_limit_backend(backend: str = "memory", path: str = "rate_limits.db"):
+    if backend == "sqlite":
+        return SQLiteBucketBackend(path)
+    return InMemoryBucketBackend()
+
+
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded) -> JSONResponse:
+    return JSONResponse(
+        {"error": str(exc)},
+        status_code=429,
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
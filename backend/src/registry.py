@@ -0,0 +1,48 @@
+from typing import TYPE_CHECKING, Awaitable, Callable, List
+
+from src.metrics import GUARD_VERDICTS, STAGE_LATENCY
+
+if TYPE_CHECKING:
+    from src.models import AbstractModel
+
+# Every level above this one uses the same prompts and checkers
+MAX_LEVEL = 7
+
+
+def timed_checker(checker: Callable[..., bool], guard: str, level: int) -> Callable[..., bool]:
+    def check(*args) -> bool:
+        with STAGE_LATENCY.time(stage=guard, level=level):
+            is_safe = checker(*args)
+        GUARD_VERDICTS.inc(guard=guard, level=level, verdict="safe" if is_safe else "unsafe")
+        return is_safe
+    return check
+
+
+def timed_async_checker(checker: Callable[..., Awaitable[bool]], guard: str, level: int) -> Callable[..., Awaitable[bool]]:
+    async def check(*args) -> bool:
+        with STAGE_LATENCY.time(stage=guard, level=level):
+            is_safe = await checker(*args)
+        GUARD_VERDICTS.inc(guard=guard, level=level, verdict="safe" if is_safe else "unsafe")
+        return is_safe
+    return check
+
+
+class LevelPipeline:
+    """Chat chain and guard checkers for one level, compiled once."""
+
+    def __init__(self, model: "AbstractModel", level: int):
+        self.level = level
+        self.chat_chain = model._build_chat_chain(level)
+        self.input_checker = timed_checker(model.input_guard.get_checker(level), "input_guard", level)
+        self.async_input_checker = timed_async_checker(model.input_guard.get_async_checker(level), "input_guard", level)
+        self.output_checker = timed_checker(model.output_guard.get_checker(level), "output_guard", level)
+        self.async_output_checker = timed_async_checker(model.output_guard.get_async_checker(level), "output_guard", level)
+
+
+class PipelineRegistry:
+    def __init__(self, model: "AbstractModel"):
+        self.levels: List[LevelPipeline] = [LevelPipeline(model, level) for level in range(MAX_LEVEL + 1)]
+        self.new_rule_chain = model._build_new_rule_chain()
+
+    def get(self, level: int) -> LevelPipeline:
+        return self.levels[min(level, MAX_LEVEL)]
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional
+
+from src.cache import TTLCache, hash_key
+from src.metrics import RESPONSE_CACHE_LOOKUPS
+from src.providers import parse_role_settings
+
+
+class SQLiteResponseStore:
+    """Cached answers on disk, so a restart starts with a warm cache."""
+
+    def __init__(self, path: str = "responses.db"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, answers TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def load(self, limit: int, ttl: float) -> List[tuple]:
+        """Newest (key, answers) first, dropping the expired ones"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE updated_at <= ?", (now - ttl,))
+            rows = self._conn.execute(
+                "SELECT key, answers FROM responses ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [(key, json.loads(answers)) for key, answers in rows]
+
+    def save(self, key: str, answers: List[str]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, answers, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(answers), time.time()),
+            )
+
+
+class ResponseCache:
+    """Answers to exact repeats of a chat turn, so common openings skip the provider.
+
+    A turn is the level, password, rules, history and message. Up to
+    max_variants answers are kept per turn; until that many exist, a variety
+    share of lookups misses on purpose and the fresh answer joins the others,
+    so the game doesn't always answer a greeting with the same line.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 24 * 3600, variety: float = 0.2, max_variants: int = 4,
+                 path: Optional[str] = None, rng: Callable[[], float] = random.random):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.variety = variety
+        self.max_variants = max_variants
+        self.rng = rng
+        self.store = SQLiteResponseStore(path) if path else None
+        if self.store is not None:
+            # Oldest first, so the newest end up most recently used
+            for key, answers in reversed(self.store.load(maxsize, ttl)):
+                self.entries.set(key, answers)
+
+    def key(self, level: int, password: str, rules: List[str], chat_history: List[dict], message: str) -> str:
+        summary = getattr(chat_history, "summary", "")
+        return hash_key(str(level), password, "\n".join(rules), json.dumps([summary, list(chat_history)]), message)
+
+    def get(self, key: str) -> Optional[str]:
+        answers = self.entries.get(key)
+        if not answers:
+            RESPONSE_CACHE_LOOKUPS.inc(result="miss")
+            return None
+        if len(answers) < self.max_variants and self.rng() < self.variety:
+            RESPONSE_CACHE_LOOKUPS.inc(result="variety")
+            return None
+        RESPONSE_CACHE_LOOKUPS.inc(result="hit")
+        return answers[int(self.rng() * len(answers))]
+
+    def add(self, key: str, text: str):
+        answers = self._add(key, text)
+        if answers is not None and self.store is not None:
+            self.store.save(key, answers)
+
+    async def aadd(self, key: str, text: str):
+        """add() for async code, writing through to SQLite in a worker thread"""
+        answers = self._add(key, text)
+        if answers is not None and self.store is not None:
+            await asyncio.to_thread(self.store.save, key, answers)
+
+    def _add(self, key: str, text: str) -> Optional[List[str]]:
+        # The answers to save, or None when text is already one of them
+        answers = list(self.entries.get(key) or [])
+        if text in answers:
+            return None
+        answers = (answers + [text])[-self.max_variants:]
+        self.entries.set(key, answers)
+        return answers
+
+
+def create_response_cache(spec: Optional[str], path: Optional[str] = None) -> Optional[ResponseCache]:
+    """RESPONSE_CACHE="variety=0.2,size=10000,ttl=86400"; "true" uses the defaults, unset disables the cache"""
+    if not spec or spec.lower() in ("false", "0", "off"):
+        return None
+    settings = parse_role_settings(spec) if "=" in spec else {}
+    return ResponseCache(
+        maxsize=int(settings.get("size", 10000)),
+        ttl=float(settings.get("ttl", 24 * 3600)),
+        variety=float(settings.get("variety", 0.2)),
+        max_variants=int(settings.get("variants", 4)),
+        path=path,
+    )
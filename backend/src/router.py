@@ -0,0 +1,227 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from src.metrics import ROUTER_HEDGES, ROUTER_REQUESTS
+from src.providers import max_tokens_kwargs
+
+
+class BackendHealth:
+    """Recent latencies and failures of one backend."""
+
+    def __init__(self, name: str, window: int = 200, failure_threshold: int = 3, cooldown: float = 30,
+                 clock=time.monotonic):
+        self.name = name
+        # Full answers and first stream chunks take very different times
+        self.latencies = {"generate": deque(maxlen=window), "stream": deque(maxlen=window)}
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        # Calls cancelled before answering, mostly ones a hedge beat
+        self.censored = {"generate": 0, "stream": 0}
+
+    def is_healthy(self) -> bool:
+        return self.clock() >= self.unhealthy_until
+
+    def record_success(self, latency: float, kind: str = "generate"):
+        self.latencies[kind].append(latency)
+        self.consecutive_failures = 0
+
+    def record_cancelled(self, elapsed: float, kind: str = "generate"):
+        # Only a lower bound of the latency, but leaving these out would drop
+        # exactly the slowest calls and pull the hedge percentile down
+        self.latencies[kind].append(elapsed)
+        self.censored[kind] += 1
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self.unhealthy_until = self.clock() + self.cooldown
+
+    def percentile(self, q: float, kind: str = "generate") -> Optional[float]:
+        if len(self.latencies[kind]) < 20:
+            return None
+        ordered = sorted(self.latencies[kind])
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RouterChatModel(BaseChatModel):
+    """Chat model that spreads calls over several backends.
+
+    Backends are tried in order, skipping those that failed failure_threshold
+    times in a row until their cooldown ends. When the chosen backend has not
+    answered (or, for streams, sent its first chunk) within the
+    hedge_percentile latency it has shown so far, the same call goes to the
+    next backend too and the first answer wins.
+    """
+
+    backends: List[BaseChatModel]
+    backend_names: List[str] = []
+    hedge_percentile: float = 0.95
+    # Used until a backend has enough samples, and as a floor so hedges stay rare
+    default_hedge_delay: float = 2.0
+    min_hedge_delay: float = 0.25
+    failure_threshold: int = 3
+    cooldown: float = 30.0
+
+    _health: List[BackendHealth] = PrivateAttr(default_factory=list)
+
+    def model_post_init(self, __context: Any):
+        names = self.backend_names or [f"backend{i}" for i in range(len(self.backends))]
+        self._health = [BackendHealth(name, failure_threshold=self.failure_threshold, cooldown=self.cooldown) for name in names]
+
+    @property
+    def _llm_type(self) -> str:
+        return "router"
+
+    @property
+    def health(self) -> List[BackendHealth]:
+        return self._health
+
+    def _ordered(self) -> List[int]:
+        healthy = [i for i, health in enumerate(self._health) if health.is_healthy()]
+        # With every backend down, still try them all rather than fail outright
+        return healthy or list(range(len(self.backends)))
+
+    def _hedge_delay(self, index: int, kind: str) -> float:
+        delay = self._health[index].percentile(self.hedge_percentile, kind)
+        if delay is None:
+            return self.default_hedge_delay
+        return max(delay, self.min_hedge_delay)
+
+    def _backend_kwargs(self, index: int, kwargs: dict) -> dict:
+        # Each provider names its output cap differently
+        kwargs = dict(kwargs)
+        max_tokens = kwargs.pop("max_tokens", None)
+        return {**kwargs, **max_tokens_kwargs(self.backends[index], max_tokens)}
+
+    def _succeeded(self, index: int, started: float, kind: str = "generate"):
+        self._health[index].record_success(time.monotonic() - started, kind)
+        ROUTER_REQUESTS.inc(backend=self._health[index].name, outcome="ok")
+
+    def _cancelled(self, index: int, started: float, kind: str = "generate"):
+        self._health[index].record_cancelled(time.monotonic() - started, kind)
+        ROUTER_REQUESTS.inc(backend=self._health[index].name, outcome="cancelled")
+
+    def _failed(self, index: int):
+        self._health[index].record_failure()
+        ROUTER_REQUESTS.inc(backend=self._health[index].name, outcome="error")
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        error = None
+        for index in self._ordered():
+            started = time.monotonic()
+            try:
+                message = self.backends[index].invoke(messages, stop=stop, **self._backend_kwargs(index, kwargs))
+            except Exception as e:
+                self._failed(index)
+                error = e
+                continue
+            self._succeeded(index, started)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        raise error
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        async def call(index: int):
+            started = time.monotonic()
+            try:
+                message = await self.backends[index].ainvoke(messages, stop=stop, **self._backend_kwargs(index, kwargs))
+            except asyncio.CancelledError:
+                self._cancelled(index, started)
+                raise
+            except Exception:
+                self._failed(index)
+                raise
+            self._succeeded(index, started)
+            return message
+
+        order = self._ordered()
+        message = await self._race([lambda i=i: call(i) for i in order], order, "generate")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _race(self, calls: List, order: List[int], kind: str):
+        """Start calls one by one, each after the previous one's hedge delay or failure; first result wins"""
+        pending = set()
+        error = None
+        next_call = 0
+        try:
+            while next_call < len(calls) or pending:
+                if next_call < len(calls):
+                    if pending:
+                        ROUTER_HEDGES.inc(backend=self._health[order[next_call]].name)
+                    pending.add(asyncio.ensure_future(calls[next_call]()))
+                    next_call += 1
+                # Wait for the newest call's hedge delay before hedging on the next backend
+                timeout = self._hedge_delay(order[next_call - 1], kind) if next_call < len(calls) else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        raise error
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        error = None
+        for index in self._ordered():
+            started = time.monotonic()
+            chunks = self.backends[index].stream(messages, stop=stop, **self._backend_kwargs(index, kwargs))
+            try:
+                # Fail over only before the first chunk, the answer can't be restarted after that
+                first = next(chunks)
+            except StopIteration:
+                self._succeeded(index, started, "stream")
+                return
+            except Exception as e:
+                self._failed(index)
+                error = e
+                continue
+            self._succeeded(index, started, "stream")
+            yield ChatGenerationChunk(message=first)
+            for chunk in chunks:
+                yield ChatGenerationChunk(message=chunk)
+            return
+        raise error
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        streams = {}
+
+        async def first_chunk(index: int):
+            started = time.monotonic()
+            stream = streams[index] = self.backends[index].astream(messages, stop=stop, **self._backend_kwargs(index, kwargs))
+            try:
+                chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                chunk = None
+            except asyncio.CancelledError:
+                self._cancelled(index, started, "stream")
+                raise
+            except Exception:
+                self._failed(index)
+                raise
+            self._succeeded(index, started, "stream")
+            return index, chunk
+
+        order = self._ordered()
+        winner, first = await self._race([lambda i=i: first_chunk(i) for i in order], order, "stream")
+        for index, stream in streams.items():
+            if index != winner:
+                await stream.aclose()
+
+        if first is None:
+            return
+        yield ChatGenerationChunk(message=first)
+        async for chunk in streams[winner]:
+            yield ChatGenerationChunk(message=chunk)
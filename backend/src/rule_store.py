@@ -0,0 +1,135 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from src.cache import TTLCache
+
+
+class RuleStore:
+    """Rules generated after each win, kept per game session.
+
+    The a-prefixed methods are for async code; blocking stores run there in a worker thread.
+    """
+
+    blocking = False
+
+    def get(self, session_id: str) -> List[str]:
+        raise NotImplementedError
+
+    def append(self, session_id: str, rule: str):
+        raise NotImplementedError
+
+    def clear(self, session_id: Optional[str] = None):
+        raise NotImplementedError
+
+    async def aget(self, session_id: str) -> List[str]:
+        return await self._run(self.get, session_id)
+
+    async def aappend(self, session_id: str, rule: str):
+        await self._run(self.append, session_id, rule)
+
+    async def aclear(self, session_id: Optional[str] = None):
+        await self._run(self.clear, session_id)
+
+    async def _run(self, method, *args):
+        if self.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+
+class InMemoryRuleStore(RuleStore):
+    def __init__(self, max_sessions: int = 10000, ttl: float = 24 * 3600, max_rules: int = 50):
+        self.max_rules = max_rules
+        self.rules = TTLCache(maxsize=max_sessions, ttl=ttl)
+
+    def get(self, session_id: str) -> List[str]:
+        return list(self.rules.get(session_id, ()))
+
+    def append(self, session_id: str, rule: str):
+        rules = self.get(session_id) + [rule]
+        self.rules.set(session_id, rules[-self.max_rules:])
+
+    def clear(self, session_id: Optional[str] = None):
+        if session_id is None:
+            self.rules.clear()
+        else:
+            self.rules.set(session_id, [])
+
+
+class SQLiteRuleStore(RuleStore):
+    """Rule store shared by every worker process that opens the same file.
+
+    WAL mode keeps readers off the writer lock and maps the shared index into
+    memory, so lookups from the chat endpoints stay cheap across processes.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str = "rules.db", max_sessions: int = 10000, ttl: float = 24 * 3600, max_rules: int = 50):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_rules = max_rules
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA mmap_size=67108864")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_rules ("
+            "session_id TEXT NOT NULL, position INTEGER NOT NULL, rule TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (session_id, position))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS session_rules_age ON session_rules (updated_at)")
+
+    def get(self, session_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT rule FROM session_rules WHERE session_id = ? AND updated_at > ? ORDER BY position",
+                (session_id, time.time() - self.ttl),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def append(self, session_id: str, rule: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO session_rules (session_id, position, rule, updated_at) "
+                    "SELECT ?, COALESCE(MAX(position), -1) + 1, ?, ? FROM session_rules WHERE session_id = ?",
+                    (session_id, rule, now, session_id),
+                )
+                # Touch the whole session so its rules expire together
+                self._conn.execute("UPDATE session_rules SET updated_at = ? WHERE session_id = ?", (now, session_id))
+                self._conn.execute(
+                    "DELETE FROM session_rules WHERE session_id = ? AND position <= "
+                    "(SELECT MAX(position) FROM session_rules WHERE session_id = ?) - ?",
+                    (session_id, session_id, self.max_rules),
+                )
+                self._evict(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def clear(self, session_id: Optional[str] = None):
+        with self._lock:
+            if session_id is None:
+                self._conn.execute("DELETE FROM session_rules")
+            else:
+                self._conn.execute("DELETE FROM session_rules WHERE session_id = ?", (session_id,))
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM session_rules WHERE updated_at <= ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM session_rules WHERE session_id IN ("
+            "SELECT session_id FROM session_rules GROUP BY session_id ORDER BY MAX(updated_at) DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        )
+
+
+def create_rule_store(backend: str = "memory", path: str = "rules.db") -> RuleStore:
+    if backend == "sqlite":
+        return SQLiteRuleStore(path)
+    return InMemoryRuleStore()
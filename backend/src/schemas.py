@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -19,11 +19,16 @@ class Rule(BaseModel):
 
 class ChatRequest(BaseModel):
     message: Message
-    chat_history: List[Message]
-    rules_list: List[Rule]
+    # Omit history and rules to use the ones kept server-side for the session
+    chat_history: Optional[List[Message]] = None
+    rules_list: Optional[List[Rule]] = None
     session_id: str
+    chat_id: str = ""
+    # "compact" sends coalesced text with the flags once, in start and end events
+    stream_mode: str = "words"
 
 class NewRuleRequest(BaseModel):
-    chat_history: List[Message]
-    rules_list: List[Rule]
-    session_id: str
\ No newline at end of file
+    chat_history: Optional[List[Message]] = None
+    rules_list: Optional[List[Rule]] = None
+    session_id: str
+    chat_id: str = ""
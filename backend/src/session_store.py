@@ -0,0 +1,220 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from src.cache import TTLCache
+from src.history import fold_summary
+from src.prompts import RESPONSES
+
+HISTORY_WINDOW = 5
+# First sentence of the too-long refusal, which streamed copies may not repeat byte for byte
+TOO_LONG_MARKER = RESPONSES["too_long"].split(".")[0]
+
+
+class HistoryWindow(list):
+    """Chat history that has already been filtered and formatted for the prompts.
+
+    Messages that fell out of the window live on as a rolling summary.
+    """
+
+    def __init__(self, messages: Iterable[dict] = (), summary: Optional[str] = None):
+        super().__init__(messages)
+        self.summary = summary if summary is not None else getattr(messages, "summary", "")
+
+
+def append_turn(window: List[dict], user_text: str, assistant_text: str) -> HistoryWindow:
+    # Same filtering as AbstractModel._format_chat_history, applied one turn at a time
+    if TOO_LONG_MARKER in assistant_text:
+        return HistoryWindow(window)
+
+    messages = list(window) + [
+        {"role": "user", "content": user_text},
+        {"role": "assistant", "content": assistant_text},
+    ]
+    # Only the messages leaving the window are summarized, the rest of the summary is reused
+    summary = fold_summary(getattr(window, "summary", ""), messages[:-HISTORY_WINDOW])
+    return HistoryWindow(messages[-HISTORY_WINDOW:], summary)
+
+
+class UnknownSession(Exception):
+    """Raised for a request without history or rules when the server holds none for it"""
+
+    def __init__(self, session_id: str, chat_id: str):
+        super().__init__(f"No stored rules or history for session {session_id}, chat {chat_id!r}; send chat_history and rules_list")
+        self.session_id = session_id
+        self.chat_id = chat_id
+
+
+class SessionStore:
+    """Per-session rules and per-chat history windows, so clients only send the new message.
+
+    The a-prefixed methods are for async code; blocking stores run there in a worker thread.
+    """
+
+    blocking = False
+
+    def get_rules(self, session_id: str) -> Optional[List[str]]:
+        raise NotImplementedError
+
+    def set_rules(self, session_id: str, rules: List[str]):
+        raise NotImplementedError
+
+    def get_history(self, session_id: str, chat_id: str) -> Optional[HistoryWindow]:
+        raise NotImplementedError
+
+    def set_history(self, session_id: str, chat_id: str, history: List[dict]):
+        raise NotImplementedError
+
+    def clear(self, session_id: str):
+        """Forget the session's rules and every one of its chats"""
+        raise NotImplementedError
+
+    def record_turn(self, session_id: str, chat_id: str, user_text: str, assistant_text: str):
+        history = self.get_history(session_id, chat_id) or HistoryWindow()
+        self.set_history(session_id, chat_id, append_turn(history, user_text, assistant_text))
+
+    async def aget_rules(self, session_id: str) -> Optional[List[str]]:
+        return await self._run(self.get_rules, session_id)
+
+    async def aset_rules(self, session_id: str, rules: List[str]):
+        await self._run(self.set_rules, session_id, rules)
+
+    async def aget_history(self, session_id: str, chat_id: str) -> Optional[HistoryWindow]:
+        return await self._run(self.get_history, session_id, chat_id)
+
+    async def aset_history(self, session_id: str, chat_id: str, history: List[dict]):
+        await self._run(self.set_history, session_id, chat_id, history)
+
+    async def arecord_turn(self, session_id: str, chat_id: str, user_text: str, assistant_text: str):
+        await self._run(self.record_turn, session_id, chat_id, user_text, assistant_text)
+
+    async def aclear(self, session_id: str):
+        await self._run(self.clear, session_id)
+
+    async def _run(self, method, *args):
+        if self.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+
+class InMemorySessionStore(SessionStore):
+    def __init__(self, max_sessions: int = 10000, ttl: float = 24 * 3600):
+        self.rules = TTLCache(maxsize=max_sessions, ttl=ttl)
+        # A session usually spans a handful of chats
+        self.histories = TTLCache(maxsize=max_sessions * 4, ttl=ttl)
+
+    def get_rules(self, session_id: str) -> Optional[List[str]]:
+        rules = self.rules.get(session_id)
+        return list(rules) if rules is not None else None
+
+    def set_rules(self, session_id: str, rules: List[str]):
+        self.rules.set(session_id, list(rules))
+
+    def get_history(self, session_id: str, chat_id: str) -> Optional[HistoryWindow]:
+        history = self.histories.get((session_id, chat_id))
+        return HistoryWindow(history) if history is not None else None
+
+    def set_history(self, session_id: str, chat_id: str, history: List[dict]):
+        self.histories.set((session_id, chat_id), HistoryWindow(history[-HISTORY_WINDOW:], getattr(history, "summary", "")))
+
+    def clear(self, session_id: str):
+        self.rules.pop(session_id)
+        for key in self.histories.keys():
+            if key[0] == session_id:
+                self.histories.pop(key)
+
+
+class SQLiteSessionStore(SessionStore):
+    blocking = True
+
+    def __init__(self, path: str = "sessions.db", max_sessions: int = 10000, ttl: float = 24 * 3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_rules ("
+            "session_id TEXT PRIMARY KEY, rules TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_histories ("
+            "session_id TEXT NOT NULL, chat_id TEXT NOT NULL, history TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (session_id, chat_id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS session_rules_age ON session_rules (updated_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chat_histories_age ON chat_histories (updated_at)")
+
+    def get_rules(self, session_id: str) -> Optional[List[str]]:
+        row = self._fetch("SELECT rules FROM session_rules WHERE session_id = ? AND updated_at > ?", (session_id,))
+        return json.loads(row[0]) if row else None
+
+    def set_rules(self, session_id: str, rules: List[str]):
+        self._upsert(
+            "INSERT OR REPLACE INTO session_rules (session_id, rules, updated_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(list(rules)), time.time()),
+            "session_rules",
+            self.max_sessions,
+        )
+
+    def get_history(self, session_id: str, chat_id: str) -> Optional[HistoryWindow]:
+        row = self._fetch(
+            "SELECT history FROM chat_histories WHERE session_id = ? AND chat_id = ? AND updated_at > ?",
+            (session_id, chat_id),
+        )
+        if not row:
+            return None
+        history = json.loads(row[0])
+        # Rows written before summaries were kept hold a bare list
+        if isinstance(history, list):
+            return HistoryWindow(history)
+        return HistoryWindow(history["messages"], history["summary"])
+
+    def set_history(self, session_id: str, chat_id: str, history: List[dict]):
+        self._upsert(
+            "INSERT OR REPLACE INTO chat_histories (session_id, chat_id, history, updated_at) VALUES (?, ?, ?, ?)",
+            (session_id, chat_id, json.dumps({"messages": history[-HISTORY_WINDOW:], "summary": getattr(history, "summary", "")}), time.time()),
+            "chat_histories",
+            self.max_sessions * 4,
+        )
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM session_rules WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM chat_histories WHERE session_id = ?", (session_id,))
+
+    def _fetch(self, query: str, params: tuple):
+        with self._lock:
+            return self._conn.execute(query, params + (time.time() - self.ttl,)).fetchone()
+
+    def _upsert(self, query: str, params: tuple, table: str, max_rows: int):
+        with self._lock:
+            self._conn.execute(query, params)
+            self._writes += 1
+            if self._writes % 100:
+                return
+            # Evict expired rows, then the least recently updated ones above the bound
+            self._conn.execute(f"DELETE FROM {table} WHERE updated_at <= ?", (time.time() - self.ttl,))
+            self._conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN ("
+                f"SELECT rowid FROM {table} ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (max_rows,),
+            )
+
+
+async def unknown_session_handler(request: Request, exc: UnknownSession) -> JSONResponse:
+    # The client resends the full payload
+    return JSONResponse({"error": str(exc)}, status_code=409)
+
+
+def create_session_store(backend: str = "memory", path: str = "sessions.db") -> SessionStore:
+    if backend == "sqlite":
+        return SQLiteSessionStore(path)
+    return InMemorySessionStore()
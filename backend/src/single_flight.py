@@ -0,0 +1,104 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+from src.cache import hash_key
+from src.metrics import SINGLE_FLIGHT_REQUESTS
+from src.schemas import ChatRequest
+
+
+def chat_request_key(kind: str, chat_request: ChatRequest) -> str:
+    """Same key for retries and double-clicks of one turn; message ids and stream mode don't matter"""
+    history = None if chat_request.chat_history is None else [(m.isUser, m.text) for m in chat_request.chat_history]
+    rules = None if chat_request.rules_list is None else [rule.title for rule in chat_request.rules_list]
+    return hash_key(kind, chat_request.session_id, chat_request.chat_id, chat_request.message.text, json.dumps([history, rules]))
+
+
+class SharedStream:
+    """Runs one async iterator and replays its items, from the first one, to every subscriber.
+
+    opened resolves once the iterator exists, or fails with the error raised while opening it.
+    """
+
+    def __init__(self, opener: Awaitable[AsyncIterator]):
+        self.items: List[Any] = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+        self.opened = asyncio.get_running_loop().create_future()
+        self.task = asyncio.ensure_future(self._run(opener))
+
+    async def _run(self, opener: Awaitable[AsyncIterator]):
+        try:
+            try:
+                items = await opener
+            except Exception as e:
+                self.opened.set_exception(e)
+                return
+            self.opened.set_result(None)
+            async for item in items:
+                self.items.append(item)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator:
+        index = 0
+        while True:
+            while index < len(self.items):
+                yield self.items[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one computation.
+
+    The computation runs in its own task, so callers that go away don't
+    cancel it for the others. Once it finishes the key is free again; this
+    is deduplication of in-flight work, not a cache.
+    """
+
+    def __init__(self):
+        self.calls: Dict[str, asyncio.Future] = {}
+        self.streams: Dict[str, SharedStream] = {}
+
+    async def do(self, key: str, factory: Callable[[], Awaitable]):
+        future = self.calls.get(key)
+        if future is None:
+            future = self.calls[key] = asyncio.ensure_future(factory())
+            future.add_done_callback(lambda f: self._forget(self.calls, key, f))
+            SINGLE_FLIGHT_REQUESTS.inc(kind="call", role="leader")
+        else:
+            SINGLE_FLIGHT_REQUESTS.inc(kind="call", role="follower")
+        return await asyncio.shield(future)
+
+    async def stream(self, key: str, factory: Callable[[], Awaitable[AsyncIterator]]) -> AsyncIterator:
+        """Subscribe to the stream factory opens; errors while opening it are raised here, before any item"""
+        shared = self.streams.get(key)
+        if shared is None:
+            shared = self.streams[key] = SharedStream(factory())
+            shared.task.add_done_callback(lambda _: self._forget(self.streams, key, shared))
+            SINGLE_FLIGHT_REQUESTS.inc(kind="stream", role="leader")
+        else:
+            SINGLE_FLIGHT_REQUESTS.inc(kind="stream", role="follower")
+        await asyncio.shield(shared.opened)
+        return shared.subscribe()
+
+    def _forget(self, flights: dict, key: str, flight):
+        if flights.get(key) is flight:
+            del flights[key]
+        # Nobody may be left to read a failed call's error
+        if isinstance(flight, asyncio.Future) and not flight.cancelled():
+            flight.exception()
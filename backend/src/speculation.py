@@ -0,0 +1,53 @@
+import asyncio
+from typing import AsyncIterator, Awaitable
+
+
+def start_speculative(generation: Awaitable) -> asyncio.Future:
+    """Start a generation before the input guard verdict is known."""
+    task = asyncio.ensure_future(generation)
+    task.add_done_callback(_discard_result)
+    return task
+
+
+def _discard_result(task: asyncio.Future):
+    # Retrieve the outcome so a cancelled or failed speculation doesn't log "never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+class SpeculativeStream:
+    """Consumes a chunk stream in the background and buffers it until iterated.
+
+    The main generation can then run while the input guard is still deciding;
+    cancel() drops it if the verdict comes back unsafe.
+    """
+
+    _DONE = object()
+
+    def __init__(self, stream: AsyncIterator):
+        self.queue = asyncio.Queue()
+        self.task = start_speculative(self._consume(stream))
+
+    async def _consume(self, stream: AsyncIterator):
+        try:
+            async for chunk in stream:
+                self.queue.put_nowait(chunk)
+        except Exception as e:
+            self.queue.put_nowait(e)
+        else:
+            self.queue.put_nowait(self._DONE)
+
+    def cancel(self):
+        self.task.cancel()
+
+    async def __aiter__(self):
+        try:
+            while True:
+                item = await self.queue.get()
+                if item is self._DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.cancel()
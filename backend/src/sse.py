@@ -0,0 +1,68 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Optional
+
+HEARTBEAT = ": ping\n\n"
+
+
+def sse_event(data, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+async def coalesce(chunks: AsyncIterator[str], max_chars: int = 256, max_wait: float = 0.05,
+                   heartbeat: float = 15) -> AsyncIterator[Optional[str]]:
+    """Merge chunks until max_chars are buffered or the oldest one waited max_wait seconds.
+
+    Yields None when nothing arrived for heartbeat seconds, so idle connections can be kept alive.
+    """
+    iterator = chunks.__aiter__()
+    buffer = ""
+    buffered_at = 0.0
+    # The pending __anext__ is never cancelled, a timeout only means we look again later
+    next_chunk = asyncio.ensure_future(iterator.__anext__())
+    try:
+        while True:
+            timeout = heartbeat if not buffer else max(0.0, buffered_at + max_wait - time.monotonic())
+            done, _ = await asyncio.wait({next_chunk}, timeout=timeout)
+            if not done:
+                if buffer:
+                    yield buffer
+                    buffer = ""
+                else:
+                    yield None
+                continue
+
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                break
+            next_chunk = asyncio.ensure_future(iterator.__anext__())
+
+            if not buffer:
+                buffered_at = time.monotonic()
+            buffer += chunk
+            if len(buffer) >= max_chars or time.monotonic() - buffered_at >= max_wait:
+                yield buffer
+                buffer = ""
+    finally:
+        if not next_chunk.done():
+            next_chunk.cancel()
+
+    if buffer:
+        yield buffer
+
+
+async def compact_events(chunks: AsyncIterator[str], header: dict, trailer: dict, max_chars: int = 256,
+                         max_wait: float = 0.05, heartbeat: float = 15) -> AsyncIterator[str]:
+    """Compact /api/chat-stream protocol.
+
+    A "start" event carries the header flags, unnamed events carry the text as
+    JSON strings, and an "end" event carries the trailer flags, read once the
+    chunks are exhausted.
+    """
+    yield sse_event(header, "start")
+    async for text in coalesce(chunks, max_chars, max_wait, heartbeat):
+        yield HEARTBEAT if text is None else sse_event(text)
+    yield sse_event(trailer, "end")
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from src.admission import AdmissionController, AdmissionRejected, parse_admission_limits
+
+
+async def hold(controller, priority, order, release):
+    async with controller.slot(priority):
+        order.append(priority)
+        await release.wait()
+
+
+def test_waiters_are_served_by_priority():
+    async def run():
+        controller = AdmissionController("test", max_concurrent=1, max_queue=3)
+        order, release = [], asyncio.Event()
+        first = asyncio.create_task(hold(controller, "chat", order, release))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(hold(controller, priority, order, release)) for priority in ("new-rule", "chat", "chat-stream")]
+        await asyncio.sleep(0)
+        assert controller.in_flight == 1 and len(controller.waiters) == 3
+        release.set()
+        await asyncio.gather(first, *waiters)
+        assert controller.in_flight == 0
+        return order
+
+    assert asyncio.run(run()) == ["chat", "chat-stream", "chat", "new-rule"]
+
+
+def test_full_queue_is_rejected_at_once():
+    async def run():
+        controller = AdmissionController("test", max_concurrent=1, max_queue=1)
+        order, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(hold(controller, "chat", order, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.slot("chat"):
+                pass
+        assert rejected.value.retry_after >= 1
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        controller = AdmissionController("test", max_concurrent=1, max_queue=1)
+        order, release = [], asyncio.Event()
+        holder = asyncio.create_task(hold(controller, "chat", order, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold(controller, "chat", order, release))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert controller.waiters == []
+        release.set()
+        await holder
+        assert controller.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_parse_admission_limits():
+    assert parse_admission_limits("groq=32:64,ollama=2:16") == {"groq": (32, 64), "ollama": (2, 16)}
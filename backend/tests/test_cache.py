@@ -0,0 +1,35 @@
+from src.cache import TTLCache, hash_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "a" in cache
+    assert "b" not in cache
+    assert len(cache) == 2
+
+
+def test_entries_expire():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set("a", False)
+    clock.now = 9
+    assert cache.get("a") is False
+    clock.now = 10
+    assert cache.get("a") is None
+    assert cache.stats() == {"size": 0, "hits": 1, "misses": 1}
+
+
+def test_hash_key_separates_parts():
+    assert hash_key("ab", "c") != hash_key("a", "bc")
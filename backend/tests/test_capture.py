@@ -0,0 +1,35 @@
+import asyncio
+
+from langchain_core.messages import HumanMessage
+
+from src.capture import CaptureCallback, CaptureLog, read_capture
+from src.fake_llm import FakeChatModel, ReplayChatModel, replay_calls
+from src.passwords import PASSWORDS
+from src.schemas import ChatRequest
+
+
+def test_anonymized_sessions_keep_their_passwords(tmp_path):
+    log = CaptureLog(str(tmp_path / "capture.jsonl"))
+    request = ChatRequest(message={"id": 1, "text": "hi", "isUser": True}, session_id="12345", chat_id="chat")
+    log.record_request("/api/chat", request)
+    log.close()
+
+    body = read_capture(str(tmp_path / "capture.jsonl"))[0]["body"]
+    assert body["session_id"] != "12345" and body["chat_id"] != "chat"
+    assert int(body["session_id"]) % len(PASSWORDS) == 12345 % len(PASSWORDS)
+    assert "chat_history" not in body
+
+
+def test_captured_calls_are_replayed_by_prompt(tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    log = CaptureLog(path)
+    llm = FakeChatModel(reply="captured answer", latency=0, tokens_per_second=0, callbacks=[CaptureCallback(log)])
+    llm.invoke([HumanMessage(content="hello")])
+    asyncio.run(llm.ainvoke([HumanMessage(content="stream me")]))
+    log.close()
+
+    replay = ReplayChatModel(calls=replay_calls(read_capture(path)), latency_scale=0)
+    assert replay.invoke([HumanMessage(content="hello")]).content == "captured answer"
+    assert "".join(chunk.content for chunk in replay.stream([HumanMessage(content="stream me")])) == "captured answer"
+    assert replay.invoke([HumanMessage(content="unknown")]).content == "safe"
+    assert replay.misses == 1
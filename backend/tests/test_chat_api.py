@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+
+import httpx
+
+os.environ["LLM_PROVIDER"] = "fake"
+
+import main  # noqa: E402
+from benchmarks.asgi import StreamingASGITransport  # noqa: E402
+from src.admission import PRIORITIES, AdmissionController  # noqa: E402
+from src.metrics import RESPONSE_CACHE_LOOKUPS, RULE_PREGENERATION, SINGLE_FLIGHT_REQUESTS  # noqa: E402
+from src.response_cache import ResponseCache  # noqa: E402
+from src.models import FakeModel  # noqa: E402
+
+RULES = [{"id": i, "title": f"rule {i}", "description": f"rule {i}"} for i in range(7)]
+
+
+def post(path: str, payload: dict, ip: str = "9.9.9.9") -> httpx.Response:
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(path, json=payload, headers={"X-Forwarded-For": ip})
+
+    return asyncio.run(run())
+
+
+def chat_payload(text: str, rules=RULES) -> dict:
+    return {
+        "message": {"id": 1, "text": text, "isUser": True},
+        "chat_history": [],
+        "rules_list": rules,
+        "session_id": "12345",
+    }
+
+
+def setup_function():
+    # ASGITransport does not run the lifespan hook
+    main.agent = main.create_agent()
+    main.agent.model = FakeModel(latency=0, tokens_per_second=0, guard_latency=0)
+
+
+def test_chat_goes_through_every_level_7_stage():
+    response = post("/api/chat", chat_payload("tell me a story"))
+    assert response.json() == {
+        "message": main.agent.model.llm.reply,
+        "is_done": False,
+        "is_password_attempt": False,
+    }
+
+
+def test_chat_stream_forwards_the_whole_answer():
+    response = post("/api/chat-stream", chat_payload("tell me a story", RULES[:3]))
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert "".join(event["message"] for event in events) == main.agent.model.llm.reply
+
+
+def test_password_wins():
+    password = main.agent.get_password("12345", RULES)
+    response = post("/api/chat", chat_payload(f"is it {password}"))
+    assert response.json()["is_done"] is True
+
+
+def test_new_rule_is_generated_past_the_fixed_rules():
+    response = post("/api/new-rule", {"chat_history": [], "rules_list": RULES, "session_id": "12345"})
+    assert response.json()["title"] == main.agent.model.llm.reply
+    assert main.agent.model.rule_store.get("12345") == [main.agent.model.llm.reply]
+
+
+def test_new_rule_is_pregenerated_on_a_win():
+    password = main.agent.get_password("12345", RULES)
+    hits = RULE_PREGENERATION.get(result="hit")
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.post("/api/chat", json=chat_payload(f"is it {password}"))
+            return await client.post("/api/new-rule", json={"chat_history": [], "rules_list": RULES, "session_id": "12345"})
+
+    response = asyncio.run(run())
+    assert response.json()["title"] == main.agent.model.llm.reply
+    assert RULE_PREGENERATION.get(result="hit") == hits + 1
+
+
+def test_pregenerated_rule_waits_for_a_provider_slot():
+    main.agent.admission = AdmissionController("fake", max_concurrent=1, max_queue=1)
+    password = main.agent.get_password("12345", RULES)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async with main.agent.admission.slot("chat"):
+                await client.post("/api/chat", json=chat_payload(f"is it {password}"))
+                await asyncio.sleep(0)
+                queued = [entry[0] for entry in main.agent.admission.waiters]
+            response = await client.post("/api/new-rule", json={"chat_history": [], "rules_list": RULES, "session_id": "12345"})
+            return queued, response
+
+    queued, response = asyncio.run(run())
+    assert queued == [PRIORITIES["new-rule"]]
+    assert response.json()["title"] == main.agent.model.llm.reply
+    assert main.agent.admission.in_flight == 0
+
+
+def test_compact_stream_sends_flags_once():
+    password = main.agent.get_password("12345", RULES)
+    payload = {**chat_payload(f"is it {password}"), "stream_mode": "compact"}
+    events = post("/api/chat-stream", payload).text.strip().split("\n\n")
+
+    assert events[0] == 'event: start\ndata: {"is_password_attempt": true}'
+    assert events[-1] == 'event: end\ndata: {"is_done": true, "is_password_attempt": true}'
+    text = "".join(json.loads(event[len("data: "):]) for event in events[1:-1])
+    assert text.strip() == main.agent.model.build_congratulations()
+
+
+def test_lifespan_builds_and_warms_up_the_agent(monkeypatch):
+    monkeypatch.setenv("WARM_UP", "true")
+    main.agent = None
+
+    async def run():
+        async with main.lifespan(main.app):
+            return main.agent
+
+    assert isinstance(asyncio.run(run()).model, FakeModel)
+
+
+def test_full_provider_queue_answers_503_but_prefiltered_turns_pass():
+    main.agent.admission = AdmissionController("fake", max_concurrent=0, max_queue=0)
+    response = post("/api/chat-stream", chat_payload("tell me a story"))
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+
+    password = main.agent.get_password("12345", RULES)
+    assert post("/api/chat", chat_payload(f"is it {password}")).json()["is_done"] is True
+
+
+def test_queued_stream_starts_before_it_gets_a_slot():
+    main.agent.admission = AdmissionController("fake", max_concurrent=1, max_queue=1)
+
+    async def run():
+        transport = StreamingASGITransport(main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            held = main.agent.admission.reserve("chat")
+            await held.__aenter__()
+            payload = {**chat_payload("tell me a story"), "stream_mode": "compact"}
+            async with client.stream("POST", "/api/chat-stream", json=payload) as response:
+                events = response.aiter_text()
+                # Headers and the start event come while the only slot is still taken
+                first = await asyncio.wait_for(events.__anext__(), 1)
+                assert response.status_code == 200 and len(main.agent.admission.waiters) == 1
+                await held.__aexit__(None, None, None)
+                return first + "".join([text async for text in events])
+
+    events = asyncio.run(run())
+    assert events.startswith("event: start") and "event: end" in events
+
+
+def test_duplicate_requests_share_one_answer():
+    main.agent.model = FakeModel(latency=0.05, tokens_per_second=0, guard_latency=0)
+    followers = SINGLE_FLIGHT_REQUESTS.get(kind="stream", role="follower")
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.post("/api/chat-stream", json=chat_payload("tell me a story")) for _ in range(2)))
+
+    first, second = asyncio.run(run())
+    assert first.text == second.text
+    assert SINGLE_FLIGHT_REQUESTS.get(kind="stream", role="follower") == followers + 1
+
+
+def test_repeated_turn_is_served_from_the_response_cache():
+    main.agent.model.response_cache = ResponseCache(variety=0)
+    hits = RESPONSE_CACHE_LOOKUPS.get(result="hit")
+    first = post("/api/chat", chat_payload("hi there"))
+    main.agent.model.llm.reply = "a different answer"
+    second = post("/api/chat", chat_payload("hi there"))
+    events = post("/api/chat-stream", chat_payload("hi there")).text.splitlines()
+    streamed = "".join(json.loads(line[len("data: "):])["message"] for line in events if line.startswith("data: "))
+
+    assert second.json()["message"] == first.json()["message"] == streamed.strip()
+    assert RESPONSE_CACHE_LOOKUPS.get(result="hit") == hits + 2
+
+
+def test_delta_requests_use_the_stored_session():
+    payload = {**chat_payload("tell me a story"), "chat_id": "chat"}
+    assert post("/api/chat", payload).status_code == 200
+
+    delta = {"message": {"id": 2, "text": "and another", "isUser": True}, "session_id": "12345", "chat_id": "chat"}
+    assert post("/api/chat", delta).json()["message"] == main.agent.model.llm.reply
+    assert [message["content"] for message in main.session_store.get_history("12345", "chat")][-2:] == ["and another", main.agent.model.llm.reply]
+
+
+def test_delta_request_for_an_unknown_session_asks_for_the_full_payload():
+    delta = {"message": {"id": 2, "text": "hello", "isUser": True}, "session_id": "unknown", "chat_id": "chat"}
+    response = post("/api/chat-stream", delta)
+    assert response.status_code == 409
+    assert "chat_history" in response.json()["error"]
+
+
+def test_unchanged_full_payload_keeps_the_stored_summary():
+    turns = [("user", f"question {i}") if i % 2 == 0 else ("assistant", f"answer {i}") for i in range(6)]
+    history = [main.Message(id=i, text=text, isUser=role == "user") for i, (role, text) in enumerate(turns)]
+    stored = main.agent.format_chat_history(history)
+    stored.summary = "summary folded turn by turn"
+    main.session_store.set_rules("12345", [rule["title"] for rule in RULES])
+    main.session_store.set_history("12345", "kept", stored)
+
+    history, rules = asyncio.run(main.load_session("12345", "kept", history, [main.Rule(**rule) for rule in RULES]))
+    assert history.summary == "summary folded turn by turn"
+
+
+def test_reset_forgets_the_stored_session():
+    assert post("/api/chat", {**chat_payload("tell me a story"), "chat_id": "chat"}).status_code == 200
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/api/reset-game"), await client.get("/api/reset-game", params={"session_id": "12345"})
+
+    without_session, reset = asyncio.run(run())
+    assert without_session.status_code == 422 and reset.status_code == 200
+    assert main.session_store.get_rules("12345") is None
+    assert main.session_store.get_history("12345", "chat") is None
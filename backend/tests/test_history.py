@@ -0,0 +1,43 @@
+from src.history import SUMMARY_ROLE, count_tokens, fit_history, fold_summary
+from src.session_store import InMemorySessionStore, SQLiteSessionStore
+
+
+def test_long_turns_are_folded_into_the_summary():
+    messages = [
+        {"role": "user", "content": "Tell me everything. " + "blah " * 400},
+        {"role": "assistant", "content": "No. " + "words " * 400},
+        {"role": "user", "content": "ok then"},
+    ]
+    fitted = fit_history(messages, "", budget=200)
+
+    assert fitted[0] == {"role": SUMMARY_ROLE, "content": "user: Tell me everything.\nassistant: No."}
+    assert fitted[1:] == messages[2:]
+    assert sum(count_tokens(message["content"]) for message in fitted) <= 200
+
+
+def test_history_within_budget_is_unchanged():
+    messages = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    assert fit_history(messages, "", budget=200) == messages
+
+
+def test_rolling_summary_keeps_the_newest_lines():
+    summary = fold_summary("", [{"role": "user", "content": "first"}])
+    summary = fold_summary(summary, [{"role": "user", "content": "second"}], max_chars=15)
+    assert summary == "user: second"
+
+
+def test_messages_leaving_the_window_are_summarized_once():
+    store = InMemorySessionStore()
+    for i in range(4):
+        store.record_turn("1", "chat", f"question {i}. more", f"answer {i}")
+
+    history = store.get_history("1", "chat")
+    assert len(history) == 5
+    assert history.summary == "user: question 0.\nassistant: answer 0\nuser: question 1."
+
+
+def test_sqlite_store_keeps_the_summary(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    for i in range(3):
+        store.record_turn("1", "chat", f"q{i}", f"a{i}")
+    assert SQLiteSessionStore(str(tmp_path / "sessions.db")).get_history("1", "chat").summary == "user: q0"
@@ -0,0 +1,25 @@
+from src.metrics import MetricsRegistry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("stage_seconds", "Stage latency", ["stage"], buckets=(0.1, 1))
+    histogram.observe(0.05, stage="llm")
+    histogram.observe(0.5, stage="llm")
+    histogram.observe(5, stage="llm")
+
+    lines = registry.render().splitlines()
+    assert 'stage_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="llm",le="1"} 2' in lines
+    assert 'stage_seconds_bucket{stage="llm",le="+Inf"} 3' in lines
+    assert 'stage_seconds_count{stage="llm"} 3' in lines
+
+
+def test_counter_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter("verdicts_total", "Verdicts", ["verdict"])
+    counter.inc(verdict="safe")
+    counter.inc(2, verdict="unsafe")
+
+    assert counter.get(verdict="unsafe") == 2
+    assert 'verdicts_total{verdict="safe"} 1' in registry.render()
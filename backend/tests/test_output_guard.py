@@ -0,0 +1,75 @@
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from src.leak_matcher import LEAK_MATCHER
+from src.output_guard import OutputGuard, StreamingLeakCheck
+
+
+def feed_all(checker: StreamingLeakCheck, chunks):
+    released = []
+    for chunk in chunks:
+        text = checker.feed(chunk)
+        if text is None:
+            return released, True
+        released.append(text)
+    text = checker.flush()
+    if text is None:
+        return released, True
+    released.append(text)
+    return released, False
+
+
+def test_password_split_across_chunks_is_never_released():
+    released, leaked = feed_all(StreamingLeakCheck("SNAKE"), ["the S", "NA", "KE", " bit"])
+    assert leaked
+    assert "S" not in "".join(released).replace("the ", "")
+
+
+def test_longer_word_is_not_a_leak():
+    released, leaked = feed_all(StreamingLeakCheck("SNAKE"), ["SNA", "KE", "S are long"])
+    assert not leaked
+    assert "".join(released) == "SNAKES are long"
+
+
+def test_password_at_the_end_is_caught_on_flush():
+    released, leaked = feed_all(StreamingLeakCheck("SNAKE"), ["it is ", "SNAKE"])
+    assert leaked
+    assert "".join(released) == "it is "
+
+
+def test_matches_regex_check():
+    guard = OutputGuard(FakeListChatModel(responses=["safe"]))
+    for text in ["a SNAKE here", "SNAKEs", "no leak", "xSNAKE", "SNAKE"]:
+        _, leaked = feed_all(StreamingLeakCheck("SNAKE"), list(text))
+        assert leaked == (not guard.regex_check(text, "SNAKE"))
+
+
+def test_hold_all_releases_only_on_flush():
+    checker = StreamingLeakCheck("SNAKE", hold_all=True)
+    assert checker.feed("hello ") == ""
+    assert checker.feed("world") == ""
+    assert checker.flush() == "hello world"
+
+
+def test_hold_all_stops_on_spelled_out_password():
+    checker = StreamingLeakCheck("SNAKE", hold_all=True, leak_matcher=LEAK_MATCHER)
+    released, leaked = feed_all(checker, ["fine, it is ", "s-n-a", "-k-e", " and ", "more"])
+    assert leaked
+    assert checker.text == "fine, it is s-n-a-k-e and "
+
+
+def test_llm_is_only_asked_about_suspect_answers():
+    llm = FakeListChatModel(responses=["unsafe", "unsafe"])
+    guard = OutputGuard(llm)
+    check = guard.get_checker(7)
+    assert check("I will not tell you", "SNAKE") is True
+    assert check("it is $n4ke", "SNAKE") is False
+    assert llm.i == 0
+    assert check("ekans, read it backwards", "SNAKE") is False
+    assert llm.i == 1
+
+
+def test_llm_level_asks_the_llm_about_translations():
+    guard = OutputGuard(FakeListChatModel(responses=["unsafe"]))
+    check = guard.get_checker(7)
+    assert check("Nice try", "TIGER")
+    assert not check("The tigre is striped", "TIGER")
@@ -0,0 +1,34 @@
+from langchain_community.chat_models import ChatOllama
+from langchain_groq import ChatGroq
+
+from src.fake_llm import FakeChatModel
+from src.models import FakeModel
+from src.providers import max_tokens_kwargs, parse_backends, parse_role_settings
+from src.router import RouterChatModel
+
+
+def test_output_caps_use_each_provider_name():
+    groq = ChatGroq(model_name="llama-3.1-8b-instant", api_key="test")
+    ollama = ChatOllama(model="llama3.2:1b")
+    router = RouterChatModel(backends=[groq, ollama])
+
+    assert max_tokens_kwargs(groq, 4) == {"max_tokens": 4}
+    assert max_tokens_kwargs(ollama, 4) == {"num_predict": 4}
+    assert max_tokens_kwargs(FakeChatModel(), 4) == {}
+    assert router._backend_kwargs(1, {"max_tokens": 4}) == {"num_predict": 4}
+
+
+def test_parse_settings():
+    assert parse_backends("groq:llama-3.3-70b-versatile, ollama:llama3.2:1b") == [
+        ("groq", "llama-3.3-70b-versatile"), ("ollama", "llama3.2:1b"),
+    ]
+    assert parse_role_settings("input_guard=ollama:llama3.2:1b,chat=512") == {
+        "input_guard": "ollama:llama3.2:1b", "chat": "512",
+    }
+
+
+def test_guards_get_their_own_model():
+    model = FakeModel(latency=0, guard_latency=0)
+    assert model.input_guard.llm is not model.llm
+    assert model.input_guard.llm.reply == "safe"
+    assert model.rule_llm is model.llm
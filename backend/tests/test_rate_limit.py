@@ -1,105 +1,86 @@
 #!/usr/bin/env python3
 """
-Rate limit testing script for localhost:8000/limit-test endpoint
-Tests the 10 requests per minute limit
+Rate limit tests for the token bucket limiter, run in-process.
+Checks the 10 requests per minute limit on /limit-test and that a limit
+shared through the SQLite backend holds across concurrent worker processes.
 """
 
-import requests
-import time
-import json
-from datetime import datetime
+import asyncio
+import multiprocessing
+import os
+
+import httpx
+
+from src.rate_limit import PRUNE_EVERY, InMemoryBucketBackend, SQLiteBucketBackend, parse_rate
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+
+def get_many(paths, ip: str = "1.2.3.4"):
+    import main
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.get(path, headers={"X-Forwarded-For": ip}) for path in paths]
+
+    return asyncio.run(run())
+
 
 def test_rate_limit():
-    base_url = "http://localhost:8000"
-    endpoint = "/limit-test"
-    url = f"{base_url}{endpoint}"
-    
-    print(f"Testing rate limit on: {url}")
-    print(f"Expected limit: 10 requests per minute")
-    print("-" * 50)
-    
-    successful_requests = 0
-    rate_limited_requests = 0
-    
-    # Make 20 requests quickly to test the rate limit
-    for i in range(1, 21):
-        try:
-            start_time = time.time()
-            response = requests.get(url, timeout=10)
-            end_time = time.time()
-            
-            timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-            response_time = (end_time - start_time) * 1000  # ms
-            
-            if response.status_code == 200:
-                successful_requests += 1
-                print(f"[{timestamp}] Request {i:2d}: ✅ SUCCESS (200) - {response_time:.0f}ms - {response.json()}")
-            elif response.status_code == 429:  # Too Many Requests
-                rate_limited_requests += 1
-                print(f"[{timestamp}] Request {i:2d}: 🚫 RATE LIMITED (429) - {response_time:.0f}ms")
-                try:
-                    error_detail = response.json()
-                    print(f"                    Error details: {error_detail}")
-                except:
-                    print(f"                    Error text: {response.text}")
-            else:
-                print(f"[{timestamp}] Request {i:2d}: ❌ ERROR ({response.status_code}) - {response_time:.0f}ms")
-                
-        except requests.exceptions.RequestException as e:
-            timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-            print(f"[{timestamp}] Request {i:2d}: 💥 CONNECTION ERROR - {str(e)}")
-        
-        # Small delay between requests to see timing
-        time.sleep(0.1)
-    
-    print("-" * 50)
-    print(f"Summary:")
-    print(f"  Successful requests: {successful_requests}")
-    print(f"  Rate limited requests: {rate_limited_requests}")
-    print(f"  Total requests made: {successful_requests + rate_limited_requests}")
-    
-    if rate_limited_requests > 0:
-        print(f"✅ Rate limiting is working! Got rate limited after {successful_requests} requests.")
-    else:
-        print(f"⚠️  Rate limiting might not be working - all {successful_requests} requests succeeded.")
-
-def test_rate_limit_recovery():
-    """Test that rate limit resets after waiting"""
-    print("\n" + "=" * 60)
-    print("Testing rate limit recovery...")
-    print("Waiting 65 seconds for rate limit to reset...")
-    
-    url = "http://localhost:8000/limit-test"
-    
-    # Wait for rate limit to reset (60 seconds + buffer)
-    for remaining in range(65, 0, -1):
-        print(f"\rWaiting... {remaining} seconds remaining", end="", flush=True)
-        time.sleep(1)
-    
-    print("\nTesting after rate limit reset:")
-    
-    try:
-        response = requests.get(url, timeout=10)
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        
-        if response.status_code == 200:
-            print(f"[{timestamp}] ✅ SUCCESS after reset: {response.json()}")
+    responses = get_many(["/limit-test"] * 20)
+    status_codes = [response.status_code for response in responses]
+
+    assert status_codes == [200] * 10 + [429] * 10
+    assert int(responses[-1].headers["Retry-After"]) >= 1
+    assert responses[-1].json() == {"error": "Rate limit exceeded: 10 per 1 minute"}
+
+
+def test_rate_limit_is_per_client():
+    responses = get_many(["/limit-test"] * 3, ip="5.6.7.8")
+    assert all(response.status_code == 200 for response in responses)
+
+
+def take_tokens(path: str, key: str, attempts: int, allowed):
+    backend = SQLiteBucketBackend(path)
+    capacity, refill_rate = parse_rate("50/hour")
+    for _ in range(attempts):
+        if not backend.take(key, capacity, refill_rate):
+            with allowed.get_lock():
+                allowed.value += 1
+
+
+def test_rate_limit_holds_across_workers(tmp_path):
+    path = str(tmp_path / "rate_limits.db")
+    SQLiteBucketBackend(path)
+    allowed = multiprocessing.Value("i", 0)
+
+    # 4 workers x 40 requests against one 50 token bucket
+    workers = [
+        multiprocessing.Process(target=take_tokens, args=(path, "/api/chat:1.2.3.4", 40, allowed))
+        for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert allowed.value == 50
+
+
+def test_refilled_buckets_are_pruned(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("src.rate_limit.time.time", lambda: clock[0])
+    capacity, refill_rate = parse_rate("10/minute")
+    for backend in (InMemoryBucketBackend(), SQLiteBucketBackend(str(tmp_path / "rate_limits.db"))):
+        backend.register(capacity, refill_rate)
+        backend.take("old", capacity, refill_rate)
+        clock[0] += 61
+        for i in range(PRUNE_EVERY - 1):
+            backend.take(f"new {i % 3}", capacity, refill_rate)
+        if isinstance(backend, InMemoryBucketBackend):
+            keys = set(backend.buckets)
         else:
-            print(f"[{timestamp}] ❌ Still getting error: {response.status_code}")
-    except requests.exceptions.RequestException as e:
-        print(f"Connection error: {e}")
-
-if __name__ == "__main__":
-    print("🚀 Starting rate limit test...")
-    print("Make sure your FastAPI server is running on localhost:8000")
-    print()
-    
-    # First test - rapid requests to trigger rate limit
-    test_rate_limit()
-    
-    # Ask user if they want to test recovery
-    user_input = input("\nDo you want to test rate limit recovery? (y/n): ").lower().strip()
-    if user_input in ['y', 'yes']:
-        test_rate_limit_recovery()
-    
-    print("\n🏁 Rate limit testing complete!") 
\ No newline at end of file
+            keys = {row[0] for row in backend._conn.execute("SELECT key FROM buckets")}
+        assert keys == {"new 0", "new 1", "new 2"}
+        clock[0] += 61
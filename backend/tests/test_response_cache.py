@@ -0,0 +1,55 @@
+import asyncio
+
+from src.response_cache import ResponseCache, create_response_cache
+
+
+def make_cache(rolls, **kwargs):
+    rolls = iter(rolls)
+    return ResponseCache(rng=lambda: next(rolls), **kwargs)
+
+
+def test_variety_misses_until_enough_answers():
+    cache = make_cache([0.1, 0.9, 0.0, 0.9], variety=0.5, max_variants=2)
+    key = cache.key(5, "SNAKE", ["rule"], [], "hi")
+    assert cache.get(key) is None
+    cache.add(key, "hello")
+    # One roll decides on variety while answers are missing, another picks the answer
+    assert cache.get(key) is None
+    assert cache.get(key) == "hello"
+    cache.add(key, "hi there")
+    assert cache.get(key) == "hi there"
+
+
+def test_key_depends_on_every_part_of_the_turn():
+    cache = ResponseCache()
+    keys = {
+        cache.key(5, "SNAKE", ["rule"], [], "hi"),
+        cache.key(6, "SNAKE", ["rule"], [], "hi"),
+        cache.key(5, "TIGER", ["rule"], [], "hi"),
+        cache.key(5, "SNAKE", [], [], "hi"),
+        cache.key(5, "SNAKE", ["rule"], [{"role": "user", "content": "yo"}], "hi"),
+        cache.key(5, "SNAKE", ["rule"], [], "hello"),
+    }
+    assert len(keys) == 6
+
+
+def test_answers_survive_a_restart(tmp_path):
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(variety=0, path=path)
+    key = cache.key(5, "SNAKE", [], [], "hi")
+    cache.add(key, "hello")
+    assert ResponseCache(variety=0, path=path).get(key) == "hello"
+
+
+def test_async_add_writes_through(tmp_path):
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(variety=0, path=path)
+    key = cache.key(5, "SNAKE", [], [], "hi")
+    asyncio.run(cache.aadd(key, "hello"))
+    assert cache.get(key) == "hello"
+    assert ResponseCache(variety=0, path=path).get(key) == "hello"
+
+
+def test_cache_is_opt_in():
+    assert create_response_cache(None) is None
+    assert create_response_cache("variety=0.5,variants=3").max_variants == 3
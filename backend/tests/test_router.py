@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+from src.fake_llm import FakeChatModel
+from src.router import RouterChatModel
+
+
+def make_router(primary: FakeChatModel, secondary: FakeChatModel) -> RouterChatModel:
+    return RouterChatModel(backends=[primary, secondary], backend_names=["primary", "secondary"], default_hedge_delay=0.05)
+
+
+def test_slow_primary_is_hedged():
+    router = make_router(FakeChatModel(reply="slow", latency=1), FakeChatModel(reply="fast", latency=0))
+    started = time.perf_counter()
+    assert asyncio.run(router.ainvoke("hi")).content == "fast"
+    assert time.perf_counter() - started < 0.5
+    # The cancelled slow call still counts, at least as long as it ran
+    assert router.health[0].censored["generate"] == 1
+    assert router.health[0].latencies["generate"][0] >= 0.05
+
+
+def test_fast_primary_is_not_hedged():
+    router = make_router(FakeChatModel(reply="primary", latency=0), FakeChatModel(reply="secondary", latency=0))
+    assert asyncio.run(router.ainvoke("hi")).content == "primary"
+    assert len(router.health[1].latencies["generate"]) == 0
+
+
+def test_failing_backend_is_skipped_until_its_cooldown_ends():
+    router = make_router(FakeChatModel(reply="down", latency=0, failure_rate=1), FakeChatModel(reply="up", latency=0))
+    for _ in range(3):
+        assert router.invoke("hi").content == "up"
+    assert not router.health[0].is_healthy()
+    assert router._ordered() == [1]
+
+
+def test_stream_hedges_on_the_first_chunk():
+    router = make_router(
+        FakeChatModel(reply="slow answer", latency=1),
+        FakeChatModel(reply="fast answer", latency=0, tokens_per_second=0),
+    )
+
+    async def run():
+        return "".join([chunk.content async for chunk in router.astream("hi")])
+
+    assert asyncio.run(run()) == "fast answer"
+    assert router.health[0].censored["stream"] == 1
+    assert router.health[0].latencies["stream"][0] >= 0.05
+
+
+def test_hedge_percentile_comes_from_the_environment(monkeypatch):
+    import main
+
+    monkeypatch.setenv("LLM_PROVIDER", "router")
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+    monkeypatch.setenv("LLM_HEDGE_PERCENTILE", "0.9")
+    assert main.create_agent().model.llm.hedge_percentile == 0.9
@@ -0,0 +1,50 @@
+import asyncio
+import multiprocessing
+
+from src.rule_store import InMemoryRuleStore, SQLiteRuleStore
+
+
+def append_rules(path: str, session_id: str, count: int):
+    store = SQLiteRuleStore(path)
+    for i in range(count):
+        store.append(session_id, f"rule {i}")
+
+
+def test_in_memory_store_is_per_session_and_bounded():
+    store = InMemoryRuleStore(max_rules=2)
+    for rule in ["a", "b", "c"]:
+        store.append("1", rule)
+    store.append("2", "x")
+
+    assert store.get("1") == ["b", "c"]
+    store.clear("1")
+    assert store.get("1") == []
+    assert store.get("2") == ["x"]
+
+
+def test_sqlite_store_is_consistent_across_processes(tmp_path):
+    path = str(tmp_path / "rules.db")
+    SQLiteRuleStore(path)
+
+    workers = [multiprocessing.Process(target=append_rules, args=(path, str(i % 2), 10)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    store = SQLiteRuleStore(path)
+    assert len(store.get("0")) == 20
+    assert len(store.get("1")) == 20
+    assert store.get("2") == []
+
+
+def test_async_access_to_the_sqlite_store(tmp_path):
+    store = SQLiteRuleStore(str(tmp_path / "rules.db"))
+
+    async def run():
+        await store.aappend("1", "first")
+        rules = await store.aget("1")
+        await store.aclear("1")
+        return rules, await store.aget("1")
+
+    assert asyncio.run(run()) == (["first"], [])
@@ -0,0 +1,51 @@
+import asyncio
+
+from src.prompts import RESPONSES
+from src.session_store import InMemorySessionStore, SQLiteSessionStore
+
+
+def record_turns(store, turns):
+    for user_text, assistant_text in turns:
+        store.record_turn("1", "chat", user_text, assistant_text)
+
+
+def test_window_keeps_last_messages_and_skips_too_long_turns():
+    store = InMemorySessionStore()
+    record_turns(store, [
+        ("one", "a"),
+        ("two", "b"),
+        ("long", RESPONSES["too_long"]),
+        ("three", "c"),
+    ])
+    history = store.get_history("1", "chat")
+    assert [msg["content"] for msg in history] == ["a", "two", "b", "three", "c"]
+    assert store.get_history("1", "other") is None
+
+
+def test_sqlite_store_round_trip(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    store.set_rules("1", ["first", "second"])
+    record_turns(store, [("hi", "hello")])
+
+    reopened = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    assert reopened.get_rules("1") == ["first", "second"]
+    assert reopened.get_history("1", "chat") == [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "hello"},
+    ]
+    assert reopened.get_rules("2") is None
+
+
+def test_async_access_to_the_sqlite_store(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+
+    async def run():
+        await store.aset_rules("1", ["first"])
+        await store.arecord_turn("1", "chat", "hi", "hello")
+        stored = await store.aget_rules("1"), await store.aget_history("1", "chat")
+        await store.aclear("1")
+        return stored, await store.aget_rules("1"), await store.aget_history("1", "chat")
+
+    (rules, history), cleared_rules, cleared_history = asyncio.run(run())
+    assert rules == ["first"] and [message["content"] for message in history] == ["hi", "hello"]
+    assert cleared_rules is None and cleared_history is None
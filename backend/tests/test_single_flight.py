@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from src.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def run():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do("key", compute) for _ in range(3)))
+        assert flights.calls == {}
+        return results
+
+    assert asyncio.run(run()) == ["answer"] * 3
+    assert calls == [1]
+
+
+def test_late_stream_subscriber_gets_every_chunk():
+    async def chunks():
+        for chunk in ("a", "b", "c"):
+            await asyncio.sleep(0.01)
+            yield chunk
+
+    async def opened():
+        return chunks()
+
+    async def run():
+        flights = SingleFlight()
+        first = await flights.stream("key", opened)
+        head = await first.__anext__()
+        late = await flights.stream("key", opened)
+        return [head] + [chunk async for chunk in first], [chunk async for chunk in late]
+
+    assert asyncio.run(run()) == (["a", "b", "c"], ["a", "b", "c"])
+
+
+def test_stream_errors_reach_every_subscriber():
+    async def failing():
+        yield "a"
+        raise ValueError("provider down")
+
+    async def opened():
+        return failing()
+
+    async def run():
+        flights = SingleFlight()
+        subscribers = [await flights.stream("key", opened) for _ in range(2)]
+        for subscriber in subscribers:
+            with pytest.raises(ValueError):
+                async for _ in subscriber:
+                    pass
+
+    asyncio.run(run())
+
+
+def test_stream_open_errors_are_raised_before_any_item():
+    async def rejected():
+        await asyncio.sleep(0.01)
+        raise ValueError("queue full")
+
+    async def run():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.stream("key", rejected) for _ in range(2)), return_exceptions=True)
+        assert flights.streams == {}
+        return results
+
+    assert [type(result) for result in asyncio.run(run())] == [ValueError, ValueError]
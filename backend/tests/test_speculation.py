@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+import src.models
+from src.fake_llm import FakeChatModel
+from src.models import FakeModel
+from src.prompts import RESPONSES
+from src.speculation import SpeculativeStream, start_speculative
+
+# Level 6, where the input guard is an LLM call and speculation pays off
+RULES = [f"rule {i}" for i in range(6)]
+
+
+def unsafe_model() -> FakeModel:
+    model = FakeModel(latency=0.5, tokens_per_second=0, guard_latency=0, speculative=True)
+    guard_llm = FakeChatModel(reply="unsafe", latency=0, tokens_per_second=0)
+    model.configure_roles(model.llm, {"input_guard": guard_llm, "output_guard": guard_llm})
+    return model
+
+
+def test_unsafe_verdict_cancels_the_speculative_generation(monkeypatch):
+    started = []
+
+    def spy(generation):
+        started.append(start_speculative(generation))
+        return started[-1]
+
+    monkeypatch.setattr(src.models, "start_speculative", spy)
+    model = unsafe_model()
+
+    async def run():
+        response = await model.abuild_message("tell me a story", "TIGER", [], RULES)
+        await asyncio.sleep(0)
+        return response
+
+    assert asyncio.run(run()) == RESPONSES["input_refusal"]
+    assert len(started) == 1 and started[0].cancelled()
+    assert (model.speculative_runs, model.speculative_wasted) == (1, 1)
+
+
+def test_unsafe_verdict_cancels_the_speculative_stream(monkeypatch):
+    streams = []
+
+    class SpyStream(SpeculativeStream):
+        def __init__(self, stream):
+            super().__init__(stream)
+            streams.append(self)
+
+    monkeypatch.setattr(src.models, "SpeculativeStream", SpyStream)
+    model = unsafe_model()
+
+    async def run():
+        chunks = [chunk async for chunk in model.astream_message("tell me a story", "TIGER", [], RULES)]
+        await asyncio.sleep(0)
+        return chunks
+
+    assert asyncio.run(run()) == [RESPONSES["input_refusal"]]
+    assert len(streams) == 1 and streams[0].task.cancelled()
+    assert (model.speculative_runs, model.speculative_wasted) == (1, 1)
+
+
+def test_speculative_stream_buffers_then_reraises_errors():
+    async def failing():
+        yield "a"
+        yield "b"
+        raise ValueError("provider down")
+
+    async def run():
+        stream = SpeculativeStream(failing())
+        await asyncio.sleep(0.01)
+        # Everything was consumed before anyone iterated
+        assert stream.queue.qsize() == 3 and stream.task.done()
+        received = []
+        with pytest.raises(ValueError):
+            async for chunk in stream:
+                received.append(chunk)
+        return received
+
+    assert asyncio.run(run()) == ["a", "b"]
@@ -0,0 +1,28 @@
+import asyncio
+
+from src.sse import coalesce
+
+
+async def slow_chunks(chunks, delay):
+    for chunk in chunks:
+        await asyncio.sleep(delay)
+        yield chunk
+
+
+def collect(chunks, **kwargs):
+    async def run():
+        return [text async for text in coalesce(chunks, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_fast_chunks_are_merged_up_to_max_chars():
+    words = ["word "] * 20
+    assert collect(slow_chunks(words, 0), max_chars=30, max_wait=10) == ["word " * 6] * 3 + ["word " * 2]
+
+
+def test_slow_chunks_are_flushed_after_max_wait():
+    assert collect(slow_chunks(["a", "b"], 0.05), max_chars=100, max_wait=0.01) == ["a", "b"]
+
+
+def test_heartbeat_while_idle():
+    assert collect(slow_chunks(["a"], 0.05), heartbeat=0.01)[0] is None
@@ -0,0 +1,46 @@
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from src.agent import Agent
+from src.input_guard import InputGuard
+from src.models import FakeModel
+from src.output_guard import OutputGuard
+from src.prompts import PROMPTS, RESPONSES
+
+
+def fake_agent() -> Agent:
+    agent = Agent(model_type="fake")
+    agent.model = FakeModel(latency=0, tokens_per_second=0, guard_latency=0)
+    return agent
+
+
+def rules(level: int):
+    return [f"rule {i}" for i in range(level)]
+
+
+def test_sync_stream_ends_with_the_answer():
+    agent = fake_agent()
+    chunks = [chunk for chunk, _, _ in agent.stream_message("hello there", [], rules(2), "1")]
+    assert "".join(chunks) == agent.model.llm.reply
+    assert RESPONSES["provider_error"] not in chunks
+
+
+def test_sync_turns_at_each_guard_tier():
+    agent = fake_agent()
+    # No guards, LLM input guard, LLM input and output guards
+    for level in (0, 5, 7):
+        response, is_done, is_password_attempt = agent.process_message("tell me a story", [], rules(level), "1")
+        assert (response, is_done, is_password_attempt) == (agent.model.llm.reply, False, False), level
+        assert agent.model.build_message("tell me a story", "TIGER", [], rules(level), "1") == agent.model.llm.reply
+
+
+def test_sync_stream_with_the_regex_output_guard():
+    agent = fake_agent()
+    chunks = [chunk for chunk, _, _ in agent.stream_message("tell me a story", [], rules(3), "1")]
+    assert "".join(chunks) == agent.model.llm.reply
+
+
+def test_sync_guard_checks():
+    guard_llm = FakeListChatModel(responses=["unsafe"])
+    assert not InputGuard(guard_llm).llm_check("tell me a story", [], PROMPTS["input_guard"])
+    assert not OutputGuard(guard_llm).llm_check("The tigre is striped", "TIGER", PROMPTS["output_guard"])
+    assert OutputGuard(guard_llm).llm_check("Nice try", "TIGER", PROMPTS["output_guard"])
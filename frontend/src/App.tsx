@@ -187,6 +187,7 @@ function App() {
       currentMessages,
       rules,
       sessionId,
+      currentChatId,
       (text) => {
         updateMessageInChat(currentChatId, aiMessage.id, text);
       }
@@ -262,9 +263,10 @@ function App() {
   };
 
   const handleConfirmReset = async () => {
+    const previousSessionId = sessionId;
     resetGameState();
     clearAllChats();
-    await chatService.resetGame();
+    await chatService.resetGame(previousSessionId);
     
     closeResetConfirm();
     
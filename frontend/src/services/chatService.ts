@@ -10,6 +10,12 @@ export interface ChatResponse {
   error?: string;
 }
 
+// Chats whose history and rules the server already holds, as `${sessionId}:${chatId}`.
+// Module level, since a ChatService is created on every render.
+const syncedChats = new Set<string>();
+
+class UnknownSessionError extends Error {}
+
 export class ChatService {
   private readonly apiUrl: string;
 
@@ -22,15 +28,18 @@ export class ChatService {
     currentMessages: Message[],
     rules: Rule[],
     sessionId: string,
+    chatId: string,
     onMessageUpdate: (text: string) => void
   ): Promise<ChatResponse> {
     try {
-      const response = await this.makeStreamRequest(userMessage, currentMessages, rules, sessionId);
+      const response = await this.withSync(sessionId, chatId, full =>
+        this.makeStreamRequest(userMessage, full ? { chat_history: currentMessages, rules_list: rules } : {}, sessionId, chatId)
+      );
       const streamResult = await this.processStreamResponse(response, onMessageUpdate);
       
       let newRule: Rule | undefined;
       if (streamResult.sessionCompleted) {
-        newRule = await this.handleSessionCompletion(currentMessages, rules, sessionId);
+        newRule = await this.handleSessionCompletion(currentMessages, rules, sessionId, chatId);
       }
 
       return {
@@ -51,11 +60,33 @@ export class ChatService {
     }
   }
 
+  // Sends only the new message once the server holds the chat, the full history and rules
+  // otherwise, or when it answers 409 because it lost them (restart, eviction)
+  private async withSync(
+    sessionId: string,
+    chatId: string,
+    request: (full: boolean) => Promise<Response>
+  ): Promise<Response> {
+    const key = `${sessionId}:${chatId}`;
+    let response: Response;
+    try {
+      response = await request(!syncedChats.has(key));
+    } catch (error) {
+      if (!(error instanceof UnknownSessionError)) {
+        throw error;
+      }
+      syncedChats.delete(key);
+      response = await request(true);
+    }
+    syncedChats.add(key);
+    return response;
+  }
+
   private async makeStreamRequest(
     userMessage: Message,
-    currentMessages: Message[],
-    rules: Rule[],
-    sessionId: string
+    state: { chat_history?: Message[]; rules_list?: Rule[] },
+    sessionId: string,
+    chatId: string
   ): Promise<Response> {
     const response = await fetch(`${this.apiUrl}/api/chat-stream`, {
       method: 'POST',
@@ -64,12 +95,16 @@ export class ChatService {
       },
       body: JSON.stringify({
         message: userMessage,
-        chat_history: currentMessages,
-        rules_list: rules,
-        session_id: sessionId
+        ...state,
+        session_id: sessionId,
+        chat_id: chatId,
+        stream_mode: 'compact'
       }),
     });
 
+    if (response.status === 409) {
+      throw new UnknownSessionError(await response.text());
+    }
     if (!response.ok) {
       const errorText = await response.text();
       console.error(`HTTP ${response.status} Error:`, errorText);
@@ -91,27 +126,31 @@ export class ChatService {
       throw new Error('No reader available');
     }
 
+    const decoder = new TextDecoder();
+    let buffer = '';
     let aiMessageText = '';
 
     while (true) {
       const { done, value } = await reader.read();
       if (done) break;
 
-      const chunk = new TextDecoder().decode(value);
-      const lines = chunk.split('\n');
-
-      for (const line of lines) {
-        if (line.startsWith('data: ')) {
-          const result = await this.processSseLine(line, aiMessageText, onMessageUpdate);
-          if (result) {
-            aiMessageText = result.aiMessageText;
-            if (result.isPasswordAttempt) {
-              wasPasswordAttempt = true;
-            }
-            if (result.isDone) {
-              sessionCompleted = true;
-            }
-          }
+      // Events can be split across reads, only handle the complete ones
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop() ?? '';
+
+      for (const rawEvent of events) {
+        const event = this.parseSseEvent(rawEvent);
+        if (!event) {
+          continue; // heartbeat
+        }
+
+        if (event.name === 'start') {
+          wasPasswordAttempt = !!event.data.is_password_attempt;
+        } else if (event.name === 'end') {
+          sessionCompleted = !!event.data.is_done;
+        } else {
+          aiMessageText = await this.revealText(aiMessageText, event.data, onMessageUpdate);
         }
       }
     }
@@ -119,62 +158,68 @@ export class ChatService {
     return { sessionCompleted, wasPasswordAttempt };
   }
 
-  private async processSseLine(
-    line: string,
-    currentAiMessageText: string,
-    onMessageUpdate: (text: string) => void
-  ): Promise<{ aiMessageText: string; isPasswordAttempt: boolean; isDone: boolean } | null> {
-    try {
-      const chunkStartTime = performance.now();
+  private parseSseEvent(rawEvent: string): { name: string; data: any } | null {
+    let name = 'message';
+    let data: string | null = null;
 
-      const jsonStr = line.substring(6); // Remove "data: " prefix
-      if (!jsonStr.trim()) {
-        return null;
-      }
-
-      const response = JSON.parse(jsonStr);
-      const { message: word, is_done, is_password_attempt } = response;
-
-      const updatedAiMessageText = currentAiMessageText + word;
-      onMessageUpdate(updatedAiMessageText);
-
-      // Calculate elapsed time for processing this chunk
-      const chunkElapsedTime = performance.now() - chunkStartTime;
-
-      // Ensure minimum delay between chunks for smooth streaming
-      if (chunkElapsedTime < GAME_CONFIG.STREAMING_DELAY_MS) {
-        const remainingDelay = Math.max(0, GAME_CONFIG.STREAMING_DELAY_MS - chunkElapsedTime);
-        await new Promise(resolve => setTimeout(resolve, remainingDelay));
+    for (const line of rawEvent.split('\n')) {
+      if (line.startsWith('event: ')) {
+        name = line.substring(7);
+      } else if (line.startsWith('data: ')) {
+        data = line.substring(6);
       }
+    }
 
-      return {
-        aiMessageText: updatedAiMessageText,
-        isPasswordAttempt: !!is_password_attempt,
-        isDone: !!is_done
-      };
+    if (data === null) {
+      return null;
+    }
 
+    try {
+      return { name, data: JSON.parse(data) };
     } catch (parseError) {
-      console.error('Error parsing SSE JSON:', parseError, 'Line:', line);
+      console.error('Error parsing SSE JSON:', parseError, 'Event:', rawEvent);
       return null;
     }
   }
 
+  private async revealText(
+    currentAiMessageText: string,
+    text: string,
+    onMessageUpdate: (text: string) => void
+  ): Promise<string> {
+    // The server sends text in batches, keep the word by word typing effect
+    let updatedAiMessageText = currentAiMessageText;
+    for (const word of text.match(/\S+\s*|\s+/g) ?? []) {
+      updatedAiMessageText += word;
+      onMessageUpdate(updatedAiMessageText);
+      await new Promise(resolve => setTimeout(resolve, GAME_CONFIG.STREAMING_DELAY_MS));
+    }
+    return updatedAiMessageText;
+  }
+
   private async handleSessionCompletion(
     currentMessages: Message[],
     rules: Rule[],
-    sessionId: string
+    sessionId: string,
+    chatId: string
   ): Promise<Rule | undefined> {
     try {
-      const newRuleResponse = await fetch(`${this.apiUrl}/api/new-rule`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          chat_history: currentMessages,
-          rules_list: rules,
-          session_id: sessionId
-        }),
+      const newRuleResponse = await this.withSync(sessionId, chatId, async full => {
+        const response = await fetch(`${this.apiUrl}/api/new-rule`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({
+            ...(full ? { chat_history: currentMessages, rules_list: rules } : {}),
+            session_id: sessionId,
+            chat_id: chatId
+          }),
+        });
+        if (response.status === 409) {
+          throw new UnknownSessionError(await response.text());
+        }
+        return response;
       });
       const newRuleData = await newRuleResponse.json();
       return newRuleData;
@@ -184,9 +229,14 @@ export class ChatService {
     }
   }
 
-  async resetGame(): Promise<void> {
+  async resetGame(sessionId: string): Promise<void> {
+    for (const key of [...syncedChats]) {
+      if (key.startsWith(`${sessionId}:`)) {
+        syncedChats.delete(key);
+      }
+    }
     try {
-      await fetch(`${this.apiUrl}/api/reset-game`);
+      await fetch(`${this.apiUrl}/api/reset-game?session_id=${encodeURIComponent(sessionId)}`);
     } catch (error) {
       console.error('Error resetting game:', error);
     }